@@ -1,4 +1,10 @@
 import os
+from typing import Any, Dict, List, Optional
+
+from .providers import run_generation
+from .utils.generation import base_params, chat_profile, compaction_profile
+from .utils.session_store import append_turn, attach_note, compact_session, get_session_store, session_lock
+from .utils.text_index import index_sentences, split_into_sentences
 
 try:
     from ibm_watsonx_ai import APIClient  # type: ignore
@@ -32,21 +38,70 @@ def _get_wx_model():
         raise RuntimeError("Missing WATSONX_APIKEY or WATSONX_PROJECT_ID")
 
     credentials = Credentials(api_key=api_key, url=url)
-    params = {
-        "decoding_method": "greedy",
-        "max_new_tokens": 768,
-        "temperature": 0.2,
-        "repetition_penalty": 1.05,
-    }
+    # Per-call budgets and stop sequences come from utils.generation profiles
+    params = base_params()
     return ModelInference(model_id=model_id, params=params, credentials=credentials, project_id=project_id)
 
-def watsonx_chat_agent(prompt: str) -> str:
-    model = _get_wx_model()
-    result = model.generate(prompt=prompt)
-    if isinstance(result, dict):
-        items = result.get("results") or []
-        return (items[0].get("generated_text", "") if items else "").strip()
-    return str(result).strip()
+def _build_session_prompt(state: Dict[str, Any], user_text: str) -> str:
+    parts = [
+        "You are a clinical assistant helping a clinician discuss a patient note. "
+        "Answer faithfully and do not fabricate details.\n"
+    ]
+    if state.get("id_to_sentence"):
+        numbered = "\n".join(f"{i}. {s}" for i, s in sorted(state["id_to_sentence"].items()))
+        parts.append("NOTE_SENTENCES:\n" + numbered + "\n")
+    if state.get("summary"):
+        parts.append("EARLIER_CONVERSATION_SUMMARY:\n" + state["summary"] + "\n")
+    for t in state.get("turns") or []:
+        parts.append(f"{t['role'].capitalize()}: {t['content']}")
+    parts.append(f"User: {user_text.strip()}\nAssistant:")
+    return "\n".join(parts)
+
+
+def _summarize_turns(previous: str, turns: List[Dict[str, str]]) -> str:
+    convo = "\n".join(f"{t['role'].capitalize()}: {t['content']}" for t in turns)
+    prompt = (
+        "Update the running summary of a clinical conversation. Keep key facts, "
+        "questions and conclusions; be concise (max 5 sentences).\n\n"
+        f"CURRENT_SUMMARY:\n{previous or '(none)'}\n\nNEW_TURNS:\n{convo}\n\nUPDATED_SUMMARY:"
+    )
+    return run_generation(prompt, compaction_profile())[0]
+
+
+def watsonx_chat_agent(
+    prompt: str,
+    session_id: Optional[str] = None,
+    note_text: Optional[str] = None,
+) -> str:
+    """
+    Send a prompt to the chat model (watsonx, or the local backend; see providers).
+
+    Without session_id the call is stateless. With session_id, prior turns are
+    loaded from the session store, kept within a token budget (older turns are
+    compacted into a running summary), and the note's sentence index is attached
+    once on the first call that provides note_text.
+
+    Optional environment:
+      - MEDSCRIBE_SESSION_TURN_BUDGET (token budget for verbatim turns, default 1200)
+    """
+    if not session_id:
+        return run_generation(prompt, chat_profile(prompt))[0]
+
+    store = get_session_store()
+    # Concurrent turns in one session would otherwise overwrite each other on save
+    with session_lock(session_id):
+        state = store.get(session_id)
+        if note_text:
+            attach_note(state, index_sentences(split_into_sentences(note_text)))
+
+        full_prompt = _build_session_prompt(state, prompt)
+        reply = run_generation(full_prompt, chat_profile(full_prompt))[0]
+        append_turn(state, "user", prompt)
+        append_turn(state, "assistant", reply)
+        budget = int(os.getenv("MEDSCRIBE_SESSION_TURN_BUDGET", "1200"))
+        compact_session(state, budget, summarize=_summarize_turns)
+        store.save(session_id, state)
+    return reply
 
 
 def terminal_input_tool(prompt_message: str = "You: ") -> str:
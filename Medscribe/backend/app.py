@@ -15,6 +15,8 @@ try:
 except Exception:
     watsonx_summarize = None  # type: ignore
 
+from .utils.ingest import ingest_limits
+
 
 def _env(key: str, default: str = "") -> str:
     return os.getenv(key, default)
@@ -24,19 +26,54 @@ def _has_watsonx_creds() -> bool:
     return bool(_env("WATSONX_APIKEY") and _env("WATSONX_PROJECT_ID"))
 
 
+def _has_live_provider() -> bool:
+    try:
+        from .providers import has_live_provider
+    except Exception:
+        return _has_watsonx_creds()
+    return has_live_provider()
+
+
 if load_dotenv:
     load_dotenv()
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
+# Werkzeug enforces this while reading the body, including chunked uploads and multipart parsing
+app.config["MAX_CONTENT_LENGTH"] = ingest_limits()["max_bytes"]
+
+if _env("LOCAL_MODEL_WARM", "0") == "1":
+    # Load the local model at startup so the first request doesn't pay for it
+    try:
+        from .providers import get_provider
+
+        get_provider("local").warm_up()
+    except Exception as exc:
+        app.logger.warning("local model warm-up failed: %s", exc)
+
+if _env("MEDSCRIBE_CASSETTE_WARM", "0") == "1":
+    # Pre-warm the response cache from recorded completions on deploy
+    try:
+        from .utils.cassette import get_cassette_store, response_cache, warm_response_cache
+
+        _cassettes = get_cassette_store()
+        if response_cache.max_items <= 0:
+            app.logger.warning("MEDSCRIBE_CASSETTE_WARM is set but MEDSCRIBE_RESPONSE_CACHE_SIZE is 0; nothing warmed")
+        elif _cassettes is None:
+            app.logger.warning("MEDSCRIBE_CASSETTE_WARM is set but MEDSCRIBE_CASSETTE_PATH is not; nothing warmed")
+        else:
+            warm_response_cache(_cassettes)
+    except Exception as exc:
+        app.logger.warning("response cache warm-up failed: %s", exc)
+
 
 def analyze_clinical_note(note_text: str, patient_context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     note_len = len(note_text or "")
     if note_len < 5:
         return {"error": "note_text must be at least 5 characters"}
 
-    live = _has_watsonx_creds()
+    live = _has_live_provider()
     if live:
         try:
             from .utils.text_index import split_into_sentences, index_sentences
@@ -50,17 +87,12 @@ def analyze_clinical_note(note_text: str, patient_context: Optional[Dict[str, An
                 numbered_sentences=pairs,
                 style=(patient_context or {}).get("style"),
             )
-            raw["model_info"] = {
-                "provider": "ibm_watsonx.ai",
-                "model": _env("WATSONX_MODEL", "ibm/granite-13b-chat-v2"),
-                "mode": "live",
-            }
             validated = validate_outputs(raw, id_to_sentence, threshold=0.30)
             return validated
         except Exception as exc:
-            return {"error": f"watsonx error: {exc}"}
+            return {"error": f"model error: {exc}"}
 
-    # Mock response for local/dev without credentials
+    # Mock response for local/dev without credentials or a local model
     summary = {
         "chief_complaint": "Chest pain",
         "history": "55-year-old with hypertension presents with intermittent chest pain for 2 days.",
@@ -81,11 +113,91 @@ def analyze_clinical_note(note_text: str, patient_context: Optional[Dict[str, An
     return {"summary": summary, "suggested_orders": suggested_orders, "model_info": model_info}
 
 
+def analyze_spooled_note(spool, patient_context: Optional[Dict[str, Any]] = None, window_sentences: int = 60) -> Dict[str, Any]:
+    """
+    Analyze a streamed document window by window so only one window of
+    sentences is in memory at a time. Sentence IDs are global across windows,
+    and id_to_sentence only carries the sentences that are actually cited.
+    Window bullets are condensed into one rollup and orders are deduplicated
+    by terminology code (or normalized name), so the response stays bounded.
+    """
+    if not _has_live_provider():
+        first = next(spool.windows(window_sentences), [])
+        return analyze_clinical_note(" ".join(s for _, s in first), patient_context)
+
+    from .timeline import rollup_items
+    from .utils.terminology import normalize
+    from .utils.text_index import index_sentences
+    from .utils.validation import validate_outputs
+    from .watsonx_summarizer import watsonx_summarize_with_citations_batch
+
+    merged: Dict[str, Any] = {"summary_bullets": [], "suggested_orders": [], "id_to_sentence": {}, "model_info": {}}
+    seen_orders = set()
+
+    def order_key(order):
+        codes = order.get("codes") or []
+        if codes:
+            return order.get("type"), codes[0]["system"], codes[0]["code"]
+        return order.get("type"), " ".join(normalize(order.get("name") or ""))
+
+    def run_batch(batch):
+        raws = watsonx_summarize_with_citations_batch(
+            [(" ".join(s for _, s in w), w) for w in batch],
+            style=(patient_context or {}).get("style"),
+        )
+        for window, raw in zip(batch, raws):
+            id_to_sentence = index_sentences(window)
+            validated = validate_outputs(raw, id_to_sentence, threshold=0.30)
+            merged["model_info"] = validated["model_info"] or merged["model_info"]
+            merged["summary_bullets"].extend(validated["summary_bullets"])
+            for order in validated["suggested_orders"]:
+                key = order_key(order)
+                if key not in seen_orders:
+                    seen_orders.add(key)
+                    merged["suggested_orders"].append(order)
+            for item in validated["summary_bullets"] + validated["suggested_orders"]:
+                for cid in item.get("citations") or []:
+                    merged["id_to_sentence"][cid] = id_to_sentence[cid]
+
+    batch_size = int(_env("MEDSCRIBE_BATCH_WINDOWS", "4"))
+    try:
+        # Only batch_size windows are held in memory at a time
+        batch = []
+        for window in spool.windows(window_sentences):
+            if len(" ".join(s for _, s in window)) < 5:
+                continue
+            batch.append(window)
+            if len(batch) >= batch_size:
+                run_batch(batch)
+                batch = []
+        if batch:
+            run_batch(batch)
+        merged["summary_bullets"] = rollup_items("one clinical document", merged["summary_bullets"])["bullets"]
+    except Exception as exc:
+        return {"error": f"model error: {exc}"}
+    # Drop sentences only cited by bullets that were condensed away
+    cited = {c for item in merged["summary_bullets"] + merged["suggested_orders"] for c in item.get("citations") or []}
+    merged["id_to_sentence"] = {i: s for i, s in merged["id_to_sentence"].items() if i in cited}
+    return merged
+
+
+@app.errorhandler(413)
+def request_too_large(exc):
+    return jsonify({"error": f"request body exceeds {app.config['MAX_CONTENT_LENGTH']} bytes"}), 413
+
+
 @app.get("/health")
 def health():
     return jsonify({"status": "ok"})
 
 
+@app.get("/stats/generation")
+def generation_stats_view():
+    from .utils.generation import generation_stats
+
+    return jsonify(generation_stats())
+
+
 @app.post("/analyze")
 def analyze():
     data = request.get_json(silent=True) or {}
@@ -96,6 +208,102 @@ def analyze():
     return jsonify(result), status
 
 
+_NDJSON_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+
+
+@app.post("/analyze/stream")
+def analyze_stream():
+    """
+    Streaming upload for large documents: text/plain, NDJSON ({"text": ...} per
+    line) or multipart/form-data with a "file" part. Optional ?style= query arg.
+    """
+    from .utils.ingest import (
+        IngestLimitError, SentenceSpool, iter_bytes, iter_ndjson_text, iter_sentences, iter_text, window_size,
+    )
+
+    limits = ingest_limits()
+    if request.mimetype == "multipart/form-data":
+        # Werkzeug spools uploaded parts to disk, so this is still a file-like stream
+        upload = request.files.get("file")
+        if upload is None:
+            return jsonify({"error": "multipart upload requires a 'file' part"}), 400
+        body, ndjson = upload.stream, upload.mimetype in _NDJSON_TYPES
+    else:
+        body, ndjson = request.stream, request.mimetype in _NDJSON_TYPES
+
+    try:
+        chunks = iter_bytes(body, limits["max_bytes"])
+        texts = iter_ndjson_text(chunks) if ndjson else iter_text(chunks)
+        with SentenceSpool(limits["spool_bytes"], limits["max_sentences"]) as spool:
+            spool.extend(iter_sentences(texts))
+            if spool.chars < 5:
+                return jsonify({"error": "note_text must be at least 5 characters"}), 400
+            result = analyze_spooled_note(
+                spool,
+                {"style": request.args.get("style")},
+                window_sentences=window_size(spool.count, limits),
+            )
+            result["ingest"] = {"sentences": spool.count, "chars": spool.chars, "spilled_to_disk": spool.spilled}
+    except IngestLimitError as exc:
+        return jsonify({"error": str(exc)}), 413
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    status = 200 if "error" not in result else 400
+    return jsonify(result), status
+
+
+@app.post("/chat")
+def chat():
+    data = request.get_json(silent=True) or {}
+    message = (data.get("message") or "").strip()
+    session_id = data.get("session_id") or None
+    note_text = data.get("note_text") or None
+    if not message:
+        return jsonify({"error": "message is required"}), 400
+    if not _has_live_provider():
+        return jsonify({"error": "No model provider configured (watsonx credentials or LOCAL_MODEL_PATH)"}), 400
+    try:
+        from .agent import watsonx_chat_agent
+
+        reply = watsonx_chat_agent(message, session_id=session_id, note_text=note_text)
+    except Exception as exc:
+        return jsonify({"error": f"model error: {exc}"}), 400
+    return jsonify({"reply": reply, "session_id": session_id})
+
+
+@app.post("/patients/<patient_id>/notes")
+def add_patient_note(patient_id: str):
+    data = request.get_json(silent=True) or {}
+    note_id = str(data.get("note_id") or "").strip()
+    if not note_id:
+        return jsonify({"error": "note_id is required"}), 400
+    result = analyze_clinical_note(data.get("note_text", ""), data.get("patient_context") or None)
+    if "error" in result:
+        return jsonify(result), 400
+
+    from .timeline import add_note, refresh_rollups
+
+    try:
+        add_note(
+            patient_id,
+            note_id,
+            result,
+            encounter_id=data.get("encounter_id") or None,
+            day=data.get("day") or None,
+        )
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    result["rollup_stats"] = refresh_rollups(patient_id)
+    return jsonify(result)
+
+
+@app.get("/patients/<patient_id>/timeline")
+def patient_timeline(patient_id: str):
+    from .timeline import get_timeline
+
+    return jsonify(get_timeline(patient_id))
+
+
 if __name__ == "__main__":
     host = os.getenv("HOST", "0.0.0.0")
     port_str = os.getenv("PORT", "5001")
@@ -24,16 +24,12 @@ class CrewAIDependencyError(RuntimeError):
     pass
 
 
-def _ensure_dependencies() -> None:
-    if Agent is None or Task is None or Crew is None:
-        raise CrewAIDependencyError(
-            "crewai is not installed. Install with: pip install crewai"
-        )
-    # Require watsonx credentials via .env
-    if not os.getenv("WATSONX_APIKEY") or not os.getenv("WATSONX_PROJECT_ID"):
-        raise CrewAIDependencyError(
-            "Missing WATSONX_APIKEY or WATSONX_PROJECT_ID in environment (.env)"
-        )
+def _crew_available() -> bool:
+    # CrewAI is wired to watsonx; other providers go through watsonx_summarize directly
+    return (
+        Agent is not None and Task is not None and Crew is not None
+        and bool(os.getenv("WATSONX_APIKEY") and os.getenv("WATSONX_PROJECT_ID"))
+    )
 
 
 def _build_llm(model: str) -> object:
@@ -70,13 +66,18 @@ def crewai_summarize(
       - CREWAI_TEMPERATURE (optional, default 0.2)
       - CREWAI_MAX_TOKENS (optional, default 800)
       - CREWAI_VERBOSE (optional, "1" to enable)
-    """
-    _ensure_dependencies()
 
+    Without CrewAI or watsonx credentials, summarization goes through the
+    provider layer instead (e.g. the local backend via LOCAL_MODEL_PATH).
+    """
     input_text = (text or "").strip()
     if len(input_text) < 5:
         raise ValueError("text must be at least 5 characters")
 
+    if not _crew_available():
+        from .watsonx_summarizer import watsonx_summarize  # type: ignore
+        return watsonx_summarize(input_text, style=style)
+
     model_name = model or os.getenv("WATSONX_MODEL", "ibm/granite-13b-chat-v2")
     llm = _build_llm(model_name)
 
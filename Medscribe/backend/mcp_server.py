@@ -28,9 +28,12 @@ def say_hello(name: str) -> dict:
 
 
 @mcp.tool()
-def agent_chat(prompt: str) -> dict:
-    """Send a prompt to the watsonx agent and return its reply."""
-    reply = watsonx_chat_agent(prompt)
+def agent_chat(prompt: str, session_id: str = "") -> dict:
+    """Send a prompt to the watsonx agent and return its reply.
+
+    Optional args: session_id (keeps conversation context server-side)
+    """
+    reply = watsonx_chat_agent(prompt, session_id=session_id or None)
     return {"reply": reply}
 
 
@@ -0,0 +1,302 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .utils.cassette import cassette_key, cassette_mode, get_cassette_store, response_cache
+from .utils.generation import estimate_tokens, generate_with_profile, record_usage, stream_until_balanced
+
+try:
+    # Local CPU inference over quantized GGUF models
+    from llama_cpp import Llama, LlamaRAMCache  # type: ignore
+except Exception:  # pragma: no cover - llama-cpp-python not installed
+    Llama = None  # type: ignore
+    LlamaRAMCache = None  # type: ignore
+
+
+__all__ = [
+    "ProviderError",
+    "WatsonxProvider",
+    "LocalProvider",
+    "get_provider",
+    "available_providers",
+    "has_live_provider",
+    "run_generation",
+    "run_generation_batch",
+]
+
+
+class ProviderError(RuntimeError):
+    pass
+
+
+class WatsonxProvider:
+    name = "ibm_watsonx.ai"
+
+    @property
+    def model_id(self) -> str:
+        return os.getenv("WATSONX_MODEL", "ibm/granite-13b-chat-v2")
+
+    def available(self) -> bool:
+        return bool(os.getenv("WATSONX_APIKEY") and os.getenv("WATSONX_PROJECT_ID"))
+
+    def _model(self):
+        from .agent import _get_wx_model
+
+        return _get_wx_model()
+
+    def generate(self, prompt: str, profile: Dict[str, Any]) -> str:
+        return generate_with_profile(self._model(), prompt, profile)
+
+    def generate_batch(self, prompts: List[str], profile: Dict[str, Any]) -> List[str]:
+        # ModelInference fans a list of prompts out concurrently server-side
+        results = self._model().generate(prompt=list(prompts), params=profile["params"])
+        out = []
+        for result in results or []:
+            items = (result or {}).get("results") or []
+            first = items[0] if items else {}
+            text = (first.get("generated_text", "") or "").strip()
+            record_usage(profile, int(first.get("generated_token_count") or estimate_tokens(text)),
+                         first.get("stop_reason") or "unknown")
+            out.append(text)
+        return out
+
+
+_local_llm = None
+_local_lock = threading.Lock()
+
+
+class LocalProvider:
+    """
+    CPU-only backend using llama.cpp with a quantized instruct model (GGUF).
+
+    Environment variables:
+      - LOCAL_MODEL_PATH (required; path to a .gguf file, e.g. a Q4_K_M granite/phi/qwen instruct)
+      - LOCAL_MODEL_NAME (optional; reported in model_info, defaults to the file name)
+      - LOCAL_MODEL_CTX (optional; context window, default 4096)
+      - LOCAL_MODEL_THREADS (optional; CPU threads, default os.cpu_count())
+    """
+
+    name = "local.llama_cpp"
+
+    @property
+    def model_id(self) -> str:
+        path = os.getenv("LOCAL_MODEL_PATH", "")
+        return os.getenv("LOCAL_MODEL_NAME", "") or os.path.basename(path) or "local"
+
+    def available(self) -> bool:
+        path = os.getenv("LOCAL_MODEL_PATH", "")
+        return Llama is not None and bool(path) and os.path.isfile(path)
+
+    def warm_up(self):
+        """Load the model once and keep it resident for the life of the process."""
+        global _local_llm
+        if _local_llm is not None:
+            return _local_llm
+        if Llama is None:
+            raise ProviderError("llama-cpp-python not installed. pip install llama-cpp-python")
+        path = os.getenv("LOCAL_MODEL_PATH", "")
+        if not path or not os.path.isfile(path):
+            raise ProviderError("LOCAL_MODEL_PATH must point to a GGUF model file")
+        with _local_lock:
+            if _local_llm is None:
+                llm = Llama(
+                    model_path=path,
+                    n_ctx=int(os.getenv("LOCAL_MODEL_CTX", "4096")),
+                    n_threads=int(os.getenv("LOCAL_MODEL_THREADS", str(os.cpu_count() or 4))),
+                    n_gpu_layers=0,
+                    use_mmap=True,
+                    verbose=False,
+                )
+                if LlamaRAMCache is not None:
+                    # Reuses KV state for shared prompt prefixes (same instructions/schema)
+                    llm.set_cache(LlamaRAMCache())
+                _local_llm = llm
+        return _local_llm
+
+    @staticmethod
+    def _kwargs(profile: Dict[str, Any]) -> Dict[str, Any]:
+        params = profile["params"]
+        greedy = params.get("decoding_method", "greedy") == "greedy"
+        return {
+            "max_tokens": int(params.get("max_new_tokens", 512)),
+            "temperature": 0.0 if greedy else float(params.get("temperature", 0.2)),
+            "repeat_penalty": float(params.get("repetition_penalty", 1.0)),
+            "stop": list(params.get("stop_sequences") or []) or None,
+        }
+
+    def generate(self, prompt: str, profile: Dict[str, Any]) -> str:
+        llm = self.warm_up()
+        kwargs = self._kwargs(profile)
+        # llama.cpp contexts are not thread-safe; serialize access to the resident model
+        with _local_lock:
+            if profile.get("json_early_stop"):
+                chunks = llm.create_completion(prompt, stream=True, **kwargs)
+                out = stream_until_balanced(_llama_chunk(c) for c in chunks)
+                text = out["text"].strip()
+                record_usage(profile, estimate_tokens(text), out["stop_reason"])
+                return text
+            result = llm.create_completion(prompt, **kwargs)
+        choice = result["choices"][0]
+        text = (choice.get("text") or "").strip()
+        used = (result.get("usage") or {}).get("completion_tokens") or estimate_tokens(text)
+        stop_reason = "max_tokens" if choice.get("finish_reason") == "length" else "eos_token"
+        record_usage(profile, int(used), stop_reason)
+        return text
+
+    def generate_batch(self, prompts: List[str], profile: Dict[str, Any]) -> List[str]:
+        # Sequential on the warm model; the prefix cache makes shared instructions nearly free
+        self.warm_up()
+        return [self.generate(p, profile) for p in prompts]
+
+
+def _llama_chunk(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    # Map llama.cpp stream chunks to the watsonx shape so truncation is counted
+    choice = chunk["choices"][0]
+    reason = {"length": "max_tokens", "stop": "eos_token"}.get(choice.get("finish_reason") or "", "not_finished")
+    return {"results": [{"generated_text": choice.get("text") or "", "stop_reason": reason}]}
+
+
+_PROVIDERS = {
+    "watsonx": WatsonxProvider(),
+    "local": LocalProvider(),
+}
+
+
+def get_provider(name: str):
+    try:
+        return _PROVIDERS[name]
+    except KeyError:
+        raise ProviderError(f"Unknown provider: {name}") from None
+
+
+def available_providers(prefer: Optional[str] = None) -> List[Any]:
+    """
+    Providers to try, in order. MEDSCRIBE_PROVIDER selects "watsonx", "local"
+    or "auto" (default: watsonx first, local as fallback for outages/offline use).
+    """
+    return [p for p in _provider_order(prefer) if p.available()]
+
+
+def _provider_order(prefer: Optional[str] = None) -> List[Any]:
+    choice = prefer or os.getenv("MEDSCRIBE_PROVIDER", "auto")
+    order = ["watsonx", "local"] if choice == "auto" else [choice]
+    return [get_provider(n) for n in order]
+
+
+def _replaying() -> bool:
+    return cassette_mode() in ("replay", "replay_or_record") and get_cassette_store() is not None
+
+
+def has_live_provider() -> bool:
+    return bool(available_providers()) or _replaying()
+
+
+def _model_info(provider) -> Dict[str, Any]:
+    return {"provider": provider.name, "model": provider.model_id, "mode": "live"}
+
+
+def run_generation(
+    prompt: str,
+    profile: Dict[str, Any],
+    prefer: Optional[str] = None,
+    meta: Optional[Dict[str, Any]] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Generate with the first provider that succeeds. Returns (text, model_info).
+
+    Completions are looked up in the response cache first (when
+    MEDSCRIBE_RESPONSE_CACHE_SIZE is set); hits still count in generation
+    stats and are recorded to the cassette store in record modes. With
+    MEDSCRIBE_CASSETTE_MODE set, calls are recorded to and/or replayed from the
+    cassette store (see utils.cassette); meta describes the call for offline replay.
+    """
+    mode = cassette_mode()
+    store = get_cassette_store() if mode != "off" else None
+    params = profile["params"]
+
+    if store is not None and mode in ("replay", "replay_or_record"):
+        hit = _replay(store, prompt, params, prefer)
+        if hit is None:
+            # Another worker may have recorded it since this store was loaded
+            store.refresh()
+            hit = _replay(store, prompt, params, prefer)
+        if hit is not None:
+            return hit
+        if mode == "replay":
+            raise ProviderError("cassette miss: no recorded completion for this prompt/model/params")
+
+    providers = available_providers(prefer)
+    if not providers:
+        raise ProviderError(
+            "No model provider configured. Set WATSONX_APIKEY/WATSONX_PROJECT_ID or LOCAL_MODEL_PATH"
+        )
+    recording = store is not None and mode in ("record", "replay_or_record")
+    errors = []
+    for provider in providers:
+        key = cassette_key(prompt, provider.model_id, params)
+        cached = response_cache.get(key)
+        if cached is not None:
+            record_usage(profile, estimate_tokens(cached), "cache_hit")
+            if recording and key not in store:
+                store.append(key, model=provider.model_id, params=params, prompt=prompt, completion=cached, meta=meta)
+            return cached, _model_info(provider)
+        try:
+            text = provider.generate(prompt, profile)
+        except Exception as exc:
+            errors.append(f"{provider.name}: {exc}")
+            continue
+        response_cache.put(key, text)
+        if recording:
+            store.append(key, model=provider.model_id, params=params, prompt=prompt, completion=text, meta=meta)
+        return text, _model_info(provider)
+    raise ProviderError("; ".join(errors))
+
+
+def _replay(store, prompt: str, params: Dict[str, Any], prefer: Optional[str]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    for provider in _provider_order(prefer):
+        rec = store.get(cassette_key(prompt, provider.model_id, params))
+        if rec is not None:
+            return rec["completion"], dict(_model_info(provider), mode="replay")
+    # Offline replays may not have the recording's model configured
+    recorded_model = os.getenv("MEDSCRIBE_CASSETTE_MODEL", "")
+    rec = store.get(cassette_key(prompt, recorded_model, params)) if recorded_model else None
+    if rec is not None:
+        return rec["completion"], {"provider": "cassette", "model": recorded_model, "mode": "replay"}
+    return None
+
+
+def run_generation_batch(
+    prompts: List[str],
+    profile: Dict[str, Any],
+    prefer: Optional[str] = None,
+    metas: Optional[List[Optional[Dict[str, Any]]]] = None,
+) -> Tuple[List[str], Dict[str, Any]]:
+    """Batched run_generation; metas (one per prompt) are passed to the cassette store."""
+    metas = metas or [None] * len(prompts)
+    if cassette_mode() != "off":
+        # Record/replay and caching are per prompt
+        results = [run_generation(p, profile, prefer, meta=m) for p, m in zip(prompts, metas)]
+        return [text for text, _ in results], (results[-1][1] if results else {})
+    providers = available_providers(prefer)
+    if not providers:
+        raise ProviderError(
+            "No model provider configured. Set WATSONX_APIKEY/WATSONX_PROJECT_ID or LOCAL_MODEL_PATH"
+        )
+    errors = []
+    for provider in providers:
+        keys = [cassette_key(p, provider.model_id, profile["params"]) for p in prompts]
+        texts = [response_cache.get(k) for k in keys]
+        missing = [i for i, t in enumerate(texts) if t is None]
+        try:
+            generated = provider.generate_batch([prompts[i] for i in missing], profile) if missing else []
+        except Exception as exc:
+            errors.append(f"{provider.name}: {exc}")
+            continue
+        for text in texts:
+            if text is not None:
+                record_usage(profile, estimate_tokens(text), "cache_hit")
+        for i, text in zip(missing, generated):
+            texts[i] = text
+            response_cache.put(keys[i], text)
+        return texts, _model_info(provider)
+    raise ProviderError("; ".join(errors))
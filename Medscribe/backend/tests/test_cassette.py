@@ -0,0 +1,126 @@
+import json
+
+import pytest
+
+from Medscribe.backend import providers
+from Medscribe.backend.utils import cassette, generation
+from Medscribe.backend.utils.cassette import CassetteStore, ResponseCache, cassette_key, replay_notes
+from Medscribe.backend.utils.generation import citation_profile, generation_stats
+from Medscribe.backend.watsonx_summarizer import _build_citation_prompt
+
+PARAMS = {"max_new_tokens": 10}
+
+
+def _append(store, key, completion="c", **meta):
+    store.append(key, model="m", params=PARAMS, prompt=key, completion=completion, meta=meta or None)
+
+
+def test_round_trip_and_index_reload(tmp_path):
+    store = CassetteStore(str(tmp_path))
+    _append(store, "k1", "one")
+    _append(store, "k2", "two")
+    reopened = CassetteStore(str(tmp_path))
+    assert len(reopened) == 2 and "k1" in reopened
+    assert reopened.get("k2")["completion"] == "two"
+
+
+def test_unindexed_tail_is_recovered_and_corrupt_record_stops_scan(tmp_path):
+    store = CassetteStore(str(tmp_path))
+    _append(store, "k1")
+    _append(store, "k2")
+    (tmp_path / "index.tsv").write_text("")
+    with open(tmp_path / "records.bin", "ab") as fh:
+        fh.write(cassette._LEN.pack(4) + b"junk")
+    reopened = CassetteStore(str(tmp_path))
+    assert len(reopened) == 2
+
+
+def test_refresh_sees_records_from_other_writers(tmp_path):
+    reader = CassetteStore(str(tmp_path))
+    _append(CassetteStore(str(tmp_path)), "k1")
+    assert "k1" not in reader
+    reader.refresh()
+    assert reader.get("k1")["completion"] == "c"
+
+
+def _record_citation(store, pairs, prompt, params):
+    meta = {"kind": "citation", "note_text": " ".join(t for _, t in pairs), "style": None, "numbered_sentences": pairs}
+    completion = json.dumps({"summary_bullets": [{"text": pairs[0][1], "citations": [pairs[0][0]]}]})
+    key = cassette_key(prompt, "m", params)
+    store.append(key, model="m", params=params, prompt=prompt, completion=completion, meta=meta)
+
+
+def test_replay_counts_each_note_once(tmp_path):
+    store = CassetteStore(str(tmp_path))
+    pairs = [(1, "Patient has chest pain.")]
+    params = citation_profile(pairs)["params"]
+    # Recorded once with an older prompt, then again with the current one
+    _record_citation(store, pairs, "old prompt", params)
+    _record_citation(store, pairs, _build_citation_prompt(pairs[0][1], pairs, None), params)
+    stats = replay_notes(store)
+    assert (stats["notes"], stats["exact_hits"], stats["misses"], stats["bullets_kept"]) == (1, 1, 0, 1)
+
+
+def test_replay_hits_short_window_recorded_with_batch_profile(tmp_path):
+    store = CassetteStore(str(tmp_path))
+    long_window = [(i, f"Sentence {i} about the patient.") for i in range(1, 61)]
+    short_window = [(i, f"Sentence {i} about the patient.") for i in range(61, 65)]
+    # Batched windows are generated with the largest window's profile
+    params = citation_profile(long_window)["params"]
+    for pairs in (long_window, short_window):
+        _record_citation(store, pairs, _build_citation_prompt(" ".join(t for _, t in pairs), pairs, None), params)
+    stats = replay_notes(store)
+    assert (stats["exact_hits"], stats["misses"]) == (2, 0)
+
+
+def test_response_cache_is_lru_and_off_when_unsized():
+    cache = ResponseCache(2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")
+    cache.put("c", "3")
+    assert cache.get("b") is None and cache.get("a") == "1"
+    off = ResponseCache(0)
+    off.put("a", "1")
+    assert off.get("a") is None
+
+
+@pytest.fixture
+def recording(monkeypatch, tmp_path):
+    calls = []
+
+    class Echo:
+        name, model_id = "echo", "echo-1"
+
+        def generate(self, prompt, profile):
+            calls.append(prompt)
+            return prompt.upper()
+
+    monkeypatch.setattr(providers, "available_providers", lambda prefer=None: [Echo()])
+    monkeypatch.setattr(providers, "_provider_order", lambda prefer=None: [Echo()])
+    monkeypatch.setattr(providers, "response_cache", ResponseCache(8))
+    monkeypatch.setattr(cassette, "_store", CassetteStore(str(tmp_path)))
+    monkeypatch.setattr(generation, "_stats", {})
+    monkeypatch.setenv("MEDSCRIBE_CASSETTE_PATH", str(tmp_path))
+    monkeypatch.setenv("MEDSCRIBE_CASSETTE_MODE", "off")
+    return calls
+
+
+def test_cache_hits_count_in_stats_and_are_recorded(recording, monkeypatch):
+    profile = generation.chat_profile("hi")
+    providers.run_generation("hi", profile)
+    monkeypatch.setenv("MEDSCRIBE_CASSETTE_MODE", "record")
+    assert providers.run_generation("hi", profile)[0] == "HI"
+    assert recording == ["hi"]
+    assert generation_stats("chat")["cache_hits"] == 1
+    assert cassette_key("hi", "echo-1", profile["params"]) in cassette.get_cassette_store()
+
+
+def test_replay_miss_refreshes_the_store(recording, monkeypatch, tmp_path):
+    profile = generation.chat_profile("hi")
+    monkeypatch.setenv("MEDSCRIBE_CASSETTE_MODE", "replay")
+    key = cassette_key("hi", "echo-1", profile["params"])
+    CassetteStore(str(tmp_path)).append(key, model="echo-1", params=profile["params"], prompt="hi", completion="recorded")
+    text, info = providers.run_generation("hi", profile)
+    assert (text, info["mode"]) == ("recorded", "replay")
+    assert recording == []
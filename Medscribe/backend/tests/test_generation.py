@@ -0,0 +1,82 @@
+import pytest
+
+from Medscribe.backend.utils import generation
+from Medscribe.backend.utils.generation import (
+    chat_profile,
+    citation_profile,
+    generate_with_profile,
+    generation_stats,
+    stream_until_balanced,
+)
+
+
+@pytest.fixture(autouse=True)
+def clean_stats(monkeypatch):
+    monkeypatch.setattr(generation, "_stats", {})
+
+
+def _chunk(text, stop_reason="not_finished"):
+    return {"results": [{"generated_text": text, "stop_reason": stop_reason}]}
+
+
+class FakeModel:
+    def __init__(self, chunks=None, result=None):
+        self.chunks = chunks or []
+        self.result = result
+        self.calls = []
+
+    def generate_text_stream(self, prompt, params, raw_response):
+        self.calls.append(("stream", params))
+        yield from self.chunks
+
+    def generate(self, prompt, params):
+        self.calls.append(("generate", params))
+        return self.result
+
+
+def test_citation_budget_scales_with_sentences_and_is_capped(monkeypatch):
+    small = citation_profile([(1, "a")] * 3)["params"]["max_new_tokens"]
+    large = citation_profile([(1, "a")] * 20)["params"]["max_new_tokens"]
+    assert small < large <= 1024
+    monkeypatch.setenv("WATSONX_MAX_NEW_TOKENS", "300")
+    assert citation_profile([(1, "a")] * 20)["params"]["max_new_tokens"] == 300
+
+
+def test_profiles_do_not_echo_stop_sequences():
+    assert chat_profile("hi")["params"]["include_stop_sequence"] is False
+    assert citation_profile([])["params"]["include_stop_sequence"] is False
+
+
+def test_stream_stops_when_top_level_object_closes():
+    chunks = [_chunk('{"a": "}{"'), _chunk(', "b": {"c": 1}} trailing'), _chunk("never read")]
+    out = stream_until_balanced(iter(chunks))
+    assert out == {"text": '{"a": "}{", "b": {"c": 1}}', "stop_reason": "json_balanced"}
+
+
+def test_stream_reports_truncation():
+    out = stream_until_balanced(iter([_chunk('{"a": ['), _chunk("1, 2", "max_tokens")]))
+    assert out["stop_reason"] == "max_tokens"
+
+
+def test_json_profile_streams_and_records_early_stop():
+    model = FakeModel(chunks=[_chunk('{"x": 1}'), _chunk(" more")])
+    profile = citation_profile([(1, "a")])
+    assert generate_with_profile(model, "p", profile) == '{"x": 1}'
+    assert model.calls[0][0] == "stream"
+    stats = generation_stats("citation_json")
+    assert stats["calls"] == 1 and stats["early_stopped"] == 1
+    assert stats["budget_tokens"] == profile["params"]["max_new_tokens"]
+
+
+def test_chat_reply_has_stop_sequence_stripped():
+    model = FakeModel(result={"results": [
+        {"generated_text": "Take aspirin.\nUser:", "generated_token_count": 5, "stop_reason": "stop_sequence"},
+    ]})
+    assert generate_with_profile(model, "p", chat_profile("p")) == "Take aspirin."
+    assert generation_stats("chat")["used_tokens"] == 5
+
+
+def test_blocking_call_counts_truncation():
+    model = FakeModel(result={"results": [{"generated_text": "abc", "stop_reason": "max_tokens"}]})
+    generate_with_profile(model, "p", chat_profile("p"))
+    assert generation_stats("chat")["truncated"] == 1
@@ -0,0 +1,77 @@
+import io
+import json
+
+import pytest
+
+from Medscribe.backend.utils.ingest import (
+    IngestLimitError,
+    SentenceSpool,
+    ingest_limits,
+    iter_bytes,
+    iter_ndjson_text,
+    iter_sentences,
+    iter_text,
+    window_size,
+)
+from Medscribe.backend.utils.text_index import split_into_sentences
+
+NOTE = "Patient has chest pain. BP 150/90!\nStarted aspirin?  Café visit noted.\n\nFollow up in 2 weeks."
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 64 * 1024])
+def test_incremental_splitter_matches_split_into_sentences(chunk_size):
+    chunks = iter_bytes(io.BytesIO(NOTE.encode("utf-8")), max_bytes=10_000, chunk_size=chunk_size)
+    assert list(iter_sentences(iter_text(chunks))) == [s for _, s in split_into_sentences(NOTE)]
+
+
+def test_byte_limit_fails_while_reading():
+    with pytest.raises(IngestLimitError):
+        list(iter_bytes(io.BytesIO(b"x" * 100), max_bytes=50, chunk_size=10))
+
+
+def test_sentence_limit():
+    with SentenceSpool(1024, max_sentences=30) as spool:
+        with pytest.raises(IngestLimitError):
+            spool.extend(f"s{i}." for i in range(31))
+
+
+def test_window_cap_widens_windows_instead_of_rejecting(monkeypatch):
+    monkeypatch.setenv("MEDSCRIBE_WINDOW_SENTENCES", "10")
+    limits = ingest_limits()
+    assert limits["max_sentences"] == 2000 and limits["max_windows"] == 200
+    assert window_size(95, limits) == 10
+    monkeypatch.setenv("MEDSCRIBE_MAX_WINDOWS", "3")
+    assert window_size(95, ingest_limits()) == 32
+
+
+def test_multi_megabyte_document_spills_and_is_accepted():
+    limits = ingest_limits()
+    sentence = "Patient reports intermittent chest discomfort " + "with exertion " * 100
+    body = (sentence.strip() + ". ").encode("utf-8") * 2000
+    assert len(body) > 2 * 1024 * 1024
+    chunks = iter_bytes(io.BytesIO(body), limits["max_bytes"])
+    with SentenceSpool(limits["spool_bytes"], limits["max_sentences"]) as spool:
+        spool.extend(iter_sentences(iter_text(chunks)))
+        assert spool.spilled and spool.count == 2000
+        size = window_size(spool.count, limits)
+        assert sum(1 for _ in spool.windows(size)) <= limits["max_windows"]
+
+
+def test_ndjson_records_become_lines():
+    body = b"\n".join(json.dumps(r).encode() for r in [{"text": "One. Two"}, {"note_text": "Three."}, "Four"])
+    texts = iter_ndjson_text(iter_bytes(io.BytesIO(body), 10_000, chunk_size=5))
+    assert list(iter_sentences(texts)) == ["One.", "Two", "Three.", "Four"]
+
+
+def test_ndjson_rejects_bad_lines():
+    with pytest.raises(ValueError):
+        list(iter_ndjson_text([b"{not json}\n"]))
+
+
+def test_spool_spills_and_windows_keep_global_ids():
+    with SentenceSpool(spool_bytes=64, max_sentences=100) as spool:
+        spool.extend(f"Sentence number {i}." for i in range(1, 26))
+        assert spool.spilled
+        windows = list(spool.windows(10))
+    assert [len(w) for w in windows] == [10, 10, 5]
+    assert windows[2][0] == (21, "Sentence number 21.")
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from Medscribe.backend import crewai_summarizer, providers
+from Medscribe.backend.utils import generation
+from Medscribe.backend.utils.generation import chat_profile, citation_profile, generation_stats
+from Medscribe.backend.watsonx_summarizer import watsonx_summarize_with_citations_batch
+
+
+class FakeLlama:
+    def __init__(self, **kwargs):
+        self.prompts = []
+        self.stream_chunks = None
+        self.fail = False
+
+    def set_cache(self, cache):
+        pass
+
+    def create_completion(self, prompt, stream=False, **kwargs):
+        if self.fail:
+            raise RuntimeError("local model crashed")
+        self.prompts.append(prompt)
+        if stream:
+            return iter(self.stream_chunks or [
+                {"choices": [{"text": json.dumps({"summary_bullets": [], "n": len(self.prompts)}), "finish_reason": None}]},
+            ])
+        return {"choices": [{"text": " hello ", "finish_reason": "stop"}], "usage": {"completion_tokens": 2}}
+
+
+@pytest.fixture
+def local_model(monkeypatch, tmp_path):
+    model_file = tmp_path / "tiny.gguf"
+    model_file.write_bytes(b"gguf")
+    monkeypatch.setenv("LOCAL_MODEL_PATH", str(model_file))
+    monkeypatch.delenv("WATSONX_APIKEY", raising=False)
+    monkeypatch.delenv("WATSONX_PROJECT_ID", raising=False)
+    monkeypatch.delenv("MEDSCRIBE_CASSETTE_MODE", raising=False)
+    monkeypatch.setattr(providers, "Llama", FakeLlama)
+    monkeypatch.setattr(providers, "LlamaRAMCache", lambda: None)
+    monkeypatch.setattr(providers, "_local_llm", None)
+    monkeypatch.setattr(generation, "_stats", {})
+    yield providers.get_provider("local").warm_up()
+
+
+def test_local_provider_is_selected_without_watsonx(local_model):
+    text, info = providers.run_generation("hi", chat_profile("hi"))
+    assert text == "hello"
+    assert info == {"provider": "local.llama_cpp", "model": "tiny.gguf", "mode": "live"}
+
+
+def test_no_provider_raises(monkeypatch):
+    monkeypatch.delenv("LOCAL_MODEL_PATH", raising=False)
+    monkeypatch.delenv("WATSONX_APIKEY", raising=False)
+    monkeypatch.delenv("MEDSCRIBE_CASSETTE_MODE", raising=False)
+    with pytest.raises(providers.ProviderError):
+        providers.run_generation("hi", chat_profile("hi"))
+
+
+def test_streaming_path_counts_length_truncation(local_model):
+    local_model.stream_chunks = [
+        {"choices": [{"text": '{"a": [1,', "finish_reason": None}]},
+        {"choices": [{"text": " 2", "finish_reason": "length"}]},
+    ]
+    providers.run_generation("p", citation_profile([(1, "a")]))
+    assert generation_stats("citation_json")["truncated"] == 1
+
+
+def test_batch_summaries_use_the_warm_model(local_model):
+    payloads = watsonx_summarize_with_citations_batch(
+        [("First window text.", [(1, "First window text.")]), ("Second window.", [(2, "Second window.")])]
+    )
+    assert [p["n"] for p in payloads] == [1, 2]
+    assert all(p["model_info"]["provider"] == "local.llama_cpp" for p in payloads)
+    assert "2. Second window." in local_model.prompts[1]
+
+
+def test_crewai_fallback_surfaces_provider_error(local_model):
+    local_model.fail = True
+    with pytest.raises(providers.ProviderError, match="local model crashed"):
+        crewai_summarizer.crewai_summarize("Patient has chest pain.")
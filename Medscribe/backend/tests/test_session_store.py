@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from Medscribe.backend import agent
+from Medscribe.backend.utils import session_store
+from Medscribe.backend.utils.session_store import (
+    InMemorySessionStore,
+    SQLiteSessionStore,
+    append_turn,
+    attach_note,
+    compact_session,
+    new_session_state,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request):
+    if request.param == "memory":
+        return InMemorySessionStore(ttl_seconds=60)
+    return SQLiteSessionStore(":memory:", ttl_seconds=60)
+
+
+def test_round_trip_keeps_integer_sentence_ids(store):
+    state = new_session_state()
+    attach_note(state, {i: f"s{i}" for i in range(1, 13)})
+    store.save("s", state)
+    loaded = store.get("s")
+    assert list(loaded["id_to_sentence"]) == list(range(1, 13))
+    prompt = agent._build_session_prompt(loaded, "hi")
+    assert prompt.index("2. s2") < prompt.index("10. s10")
+
+
+def test_get_returns_a_copy(store):
+    state = new_session_state()
+    store.save("s", state)
+    loaded = store.get("s")
+    append_turn(loaded, "user", "not saved")
+    assert store.get("s")["turns"] == []
+
+
+def test_ttl_eviction(store):
+    store.save("s", new_session_state())
+    store.ttl_seconds = 0
+    time.sleep(0.01)
+    assert store.evict_expired() == 1
+    assert store.get("s")["turns"] == []
+
+
+def test_attach_note_only_once():
+    state = new_session_state()
+    assert attach_note(state, {1: "a"})
+    assert not attach_note(state, {1: "b"})
+    assert state["id_to_sentence"] == {1: "a"}
+
+
+def test_compaction_folds_oldest_turns_into_summary():
+    state = new_session_state()
+    for i in range(10):
+        append_turn(state, "user", f"turn {i} " + "x" * 400)
+    seen = []
+
+    def summarize(previous, turns):
+        seen.extend(t["content"][:6] for t in turns)
+        return "summary of old turns"
+
+    cut = compact_session(state, budget_tokens=300, summarize=summarize)
+    assert cut == len(seen) > 0
+    assert seen[0] == "turn 0"
+    assert state["summary"] == "summary of old turns"
+    assert state["turns"][-1]["content"].startswith("turn 9")
+
+
+def test_compaction_falls_back_when_summarizer_fails():
+    state = new_session_state()
+    for i in range(5):
+        append_turn(state, "user", "y" * 400)
+
+    def boom(previous, turns):
+        raise RuntimeError("down")
+
+    assert compact_session(state, budget_tokens=150, summarize=boom) > 0
+    assert state["summary"].startswith("user: yyy")
+
+
+def test_concurrent_turns_in_one_session_are_not_lost(monkeypatch):
+    monkeypatch.setattr(session_store, "_store", InMemorySessionStore(ttl_seconds=60))
+
+    def slow_generation(prompt, profile):
+        time.sleep(0.02)
+        return "ok", {}
+
+    monkeypatch.setattr(agent, "run_generation", slow_generation)
+    threads = [
+        threading.Thread(target=agent.watsonx_chat_agent, args=(f"q{i}",), kwargs={"session_id": "s"})
+        for i in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    turns = session_store.get_session_store().get("s")["turns"]
+    assert sorted(t["content"] for t in turns if t["role"] == "user") == ["q0", "q1", "q2", "q3"]
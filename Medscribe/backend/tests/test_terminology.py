@@ -0,0 +1,74 @@
+import pytest
+
+from Medscribe.backend.utils.terminology import TerminologyIndex, _levenshtein, build_index
+
+
+@pytest.fixture
+def index(tmp_path):
+    loinc = tmp_path / "loinc.csv"
+    loinc.write_text(
+        "code,display\n"
+        "10839-9,Troponin I.cardiac\n"
+        "2345-7,Glucose\n"
+        "2160-0,Creatinine\n"
+        "99999-9,I\n"
+        "88888-8,mg\n"
+    )
+    rxnorm = tmp_path / "rxnorm.csv"
+    rxnorm.write_text("code,display\n243670,Aspirin 81 MG Oral Tablet\n318272,Aspirin 325 MG Oral Tablet\n")
+    out = str(tmp_path / "terms.idx")
+    counts = build_index([str(loinc), str(rxnorm)], out)
+    assert counts["entries"] == 7
+    idx = TerminologyIndex(out)
+    yield idx
+    idx.close()
+
+
+def test_exact_contained_term_scores_one(index):
+    (match,) = index.lookup("glucose", k=1)
+    assert match == {"system": "LOINC", "code": "2345-7", "display": "Glucose", "score": 1.0}
+    assert index.lookup("Fasting glucose")[0]["code"] == "2345-7"
+
+
+def test_fuzzy_token_match(index):
+    match = index.lookup("creatinin")[0]
+    assert match["code"] == "2160-0" and 0 < match["score"] < 1
+
+
+def test_prefix(index):
+    assert [e["code"] for e in index.prefix("aspirin")] == ["318272", "243670"]
+
+
+def test_query_covered_by_longer_term(index):
+    match = index.annotate("Troponin I", "lab")[0]
+    assert match["code"] == "10839-9"
+
+
+def test_shared_leading_tokens_match(index):
+    match = index.annotate("Aspirin 325 mg PO once", "medication")[0]
+    assert match["code"] == "318272"
+
+
+def test_single_short_tokens_are_rejected(index):
+    codes = {m["code"] for m in index.lookup("Troponin I") + index.lookup("Ondansetron 4 mg IV")}
+    assert "99999-9" not in codes and "88888-8" not in codes
+    assert index.lookup("Ondansetron 4 mg IV") == []
+
+
+def test_order_type_restricts_catalogs(index):
+    assert index.annotate("Aspirin level", "lab") == []
+    assert index.annotate("Glucose tablets 4 g PO", "medication") == []
+    assert index.annotate("Glucose tablets 4 g PO", None)[0]["code"] == "2345-7"
+
+
+@pytest.mark.parametrize("typo", ["creatinin", "creatinine", "creatinnine", "craetinine"])
+def test_fuzzy_tokens_across_length_buckets(index, typo):
+    assert [m["code"] for m in index.lookup(typo)] == ["2160-0"]
+
+
+def test_bounded_edit_distance():
+    assert _levenshtein("aspirin", "aspirin", 1) == 0
+    assert _levenshtein("aspirn", "aspirin", 1) == 1
+    assert _levenshtein("craetinine", "creatinine", 2) == 2
+    assert _levenshtein("craetinine", "creatinine", 1) == 2
+    assert _levenshtein("kitten", "sitting", 2) == 3
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+from Medscribe.backend import timeline
+from Medscribe.backend.timeline import TimelineStore, add_note, get_timeline, refresh_rollups
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = TimelineStore(":memory:")
+    monkeypatch.setattr(timeline, "_store", store)
+    monkeypatch.setattr(timeline, "has_live_provider", lambda: False)
+    return store
+
+
+@pytest.fixture
+def model(monkeypatch, store):
+    calls = []
+
+    def fake_generation(prompt, profile):
+        facts = [line for line in prompt.split("FACTS:\n", 1)[1].splitlines() if line.strip()]
+        calls.append(len(facts))
+        # Condense to the first fact, citing everything
+        text = facts[0].split(". ", 1)[1]
+        return json.dumps({"bullets": [{"text": text, "citations": list(range(1, len(facts) + 1))}]}), {}
+
+    monkeypatch.setattr(timeline, "has_live_provider", lambda: True)
+    monkeypatch.setattr(timeline, "run_generation", fake_generation)
+    return calls
+
+
+def _result(*texts):
+    return {
+        "summary_bullets": [{"text": t, "citations": [i]} for i, t in enumerate(texts, start=1)],
+        "id_to_sentence": {i: t for i, t in enumerate(texts, start=1)},
+    }
+
+
+def test_encounter_ids_with_slashes_roll_up(store):
+    add_note("p", "n1", _result("Chest pain."), encounter_id="ED/2024/001", day="2024-05-01")
+    stats = refresh_rollups("p")
+    assert stats == {"days": 1, "encounters": 1, "generations": 0}
+    enc = get_timeline("p")["encounters"][0]
+    assert enc["encounter_id"] == "ED/2024/001"
+    assert enc["days"][0]["note_ids"] == ["n1"]
+    assert enc["summary_bullets"][0]["citations"] == [{"note_id": "n1", "sentence_id": 1}]
+
+
+def test_refresh_only_touches_dirty_levels(store):
+    add_note("p", "n1", _result("a"), encounter_id="e1", day="d1")
+    add_note("p", "n2", _result("b"), encounter_id="e2", day="d1")
+    refresh_rollups("p")
+    add_note("p", "n3", _result("c"), encounter_id="e2", day="d2")
+    assert refresh_rollups("p") == {"days": 1, "encounters": 1, "generations": 0}
+    assert refresh_rollups("p") == {"days": 0, "encounters": 0, "generations": 0}
+
+
+def test_note_added_during_refresh_stays_dirty(store):
+    add_note("p", "n1", _result("a"), encounter_id="e", day="d")
+    (row,) = store.rollups("p", "day", dirty_only=True)
+    add_note("p", "n2", _result("b"), encounter_id="e", day="d")
+    assert not store.finish_rollup("p", "day", row, [{"text": "a", "citations": []}])
+    (row,) = store.rollups("p", "day", dirty_only=True)
+    assert row["pending"] == ["n2"]
+    refresh_rollups("p")
+    day = get_timeline("p")["encounters"][0]["days"][0]
+    assert [b["text"] for b in day["summary_bullets"]] == ["a", "b"]
+
+
+def test_refiled_note_is_rebuilt_out_of_old_day(store):
+    add_note("p", "n1", _result("a"), encounter_id="e", day="d1")
+    add_note("p", "n2", _result("b"), encounter_id="e", day="d1")
+    refresh_rollups("p")
+    add_note("p", "n2", _result("b2"), encounter_id="e", day="d2")
+    refresh_rollups("p")
+    days = {d["day"]: [b["text"] for b in d["summary_bullets"]] for d in get_timeline("p")["encounters"][0]["days"]}
+    assert days == {"d1": ["a"], "d2": ["b2"]}
+
+
+def test_new_note_folds_into_previous_rollups(model):
+    for i in range(40):
+        add_note("p", f"n{i}", _result(*[f"fact {i}.{j}" for j in range(3)]), encounter_id="e", day=f"d{i % 5}")
+        refresh_rollups("p")
+    model.clear()
+    add_note("p", "last", _result("x", "y", "z"), encounter_id="e", day="d0")
+    stats = refresh_rollups("p")
+    # Previous day/encounter rollup plus the new note's bullets, not every note in the encounter
+    assert stats["generations"] <= 2 and max(model, default=0) <= timeline._PASS_THROUGH_MAX + 3
+    enc = get_timeline("p")["encounters"][0]
+    assert any({"note_id": "last", "sentence_id": 3} in b["citations"] for b in enc["summary_bullets"])
+
+
+def test_mock_analysis_is_rejected(store):
+    with pytest.raises(ValueError):
+        add_note("p", "n1", {"summary": "mock"})
+
@@ -0,0 +1,348 @@
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from .providers import has_live_provider, run_generation
+from .utils.generation import rollup_profile
+from .utils.text_index import jaccard_similarity
+
+__all__ = ["TimelineStore", "get_timeline_store", "rollup_items", "add_note", "refresh_rollups", "get_timeline"]
+
+# Inputs at or below this size are passed through without a generation
+_PASS_THROUGH_MAX = 7
+_SUPPORT_THRESHOLD = 0.30
+
+
+class TimelineStore:
+    """
+    Per-patient storage of validated note outputs and their rollups.
+
+    A rollup row is either a day ("day", encounter_id, day) or an encounter
+    ("encounter", encounter_id, ""). Adding a note marks its day and encounter
+    dirty and queues its note id in "pending" so refresh can fold just the new
+    notes into the previous rollup.
+    Re-filing an existing note sets "rebuild" instead. Every mark bumps
+    "version"; a refresh only clears dirty if the version it read is unchanged.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS notes ("
+            " patient_id TEXT NOT NULL, note_id TEXT NOT NULL,"
+            " encounter_id TEXT NOT NULL, day TEXT NOT NULL,"
+            " added_at REAL NOT NULL, payload TEXT NOT NULL,"
+            " PRIMARY KEY (patient_id, note_id));"
+            "CREATE TABLE IF NOT EXISTS rollups ("
+            " patient_id TEXT NOT NULL, level TEXT NOT NULL,"
+            " encounter_id TEXT NOT NULL, day TEXT NOT NULL,"
+            " payload TEXT NOT NULL DEFAULT '[]', pending TEXT NOT NULL DEFAULT '[]',"
+            " rebuild INTEGER NOT NULL DEFAULT 0, dirty INTEGER NOT NULL DEFAULT 1,"
+            " version INTEGER NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (patient_id, level, encounter_id, day));"
+        )
+        self._conn.commit()
+
+    def put_note(
+        self,
+        patient_id: str,
+        note_id: str,
+        encounter_id: str,
+        day: str,
+        bullets: List[Dict[str, Any]],
+        id_to_sentence: Dict[int, str],
+    ) -> None:
+        payload = json.dumps({"bullets": bullets, "id_to_sentence": id_to_sentence})
+        with self._lock:
+            prev = self._conn.execute(
+                "SELECT encounter_id, day FROM notes WHERE patient_id = ? AND note_id = ?",
+                (patient_id, note_id),
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO notes VALUES (?, ?, ?, ?, ?, ?)",
+                (patient_id, note_id, encounter_id, day, time.time(), payload),
+            )
+            if prev is None:
+                self._mark_locked(patient_id, "day", encounter_id, day, pending=note_id)
+                self._mark_locked(patient_id, "encounter", encounter_id, "", pending=note_id)
+            else:
+                # Replaced or re-filed note: old content may be in the rollups, so rebuild
+                for enc, d in {(encounter_id, day), tuple(prev)}:
+                    self._mark_locked(patient_id, "day", enc, d)
+                    self._mark_locked(patient_id, "encounter", enc, "")
+            self._conn.commit()
+
+    def _mark_locked(self, patient_id: str, level: str, encounter_id: str, day: str,
+                     pending: Optional[str] = None) -> None:
+        key = (patient_id, level, encounter_id, day)
+        self._conn.execute(
+            "INSERT OR IGNORE INTO rollups (patient_id, level, encounter_id, day) VALUES (?, ?, ?, ?)", key
+        )
+        row = self._conn.execute(
+            "SELECT pending FROM rollups WHERE patient_id = ? AND level = ? AND encounter_id = ? AND day = ?", key
+        ).fetchone()
+        queued = json.loads(row[0])
+        if pending is not None and pending not in queued:
+            queued.append(pending)
+        self._conn.execute(
+            "UPDATE rollups SET dirty = 1, version = version + 1, pending = ?, rebuild = MAX(rebuild, ?) "
+            "WHERE patient_id = ? AND level = ? AND encounter_id = ? AND day = ?",
+            (json.dumps(queued), int(pending is None), *key),
+        )
+
+    def notes(self, patient_id: str, encounter_id: Optional[str] = None, day: Optional[str] = None,
+              note_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        sql = "SELECT note_id, encounter_id, day, payload FROM notes WHERE patient_id = ?"
+        args: List[Any] = [patient_id]
+        if encounter_id is not None:
+            sql += " AND encounter_id = ?"
+            args.append(encounter_id)
+        if day is not None:
+            sql += " AND day = ?"
+            args.append(day)
+        if note_ids is not None:
+            sql += " AND note_id IN (%s)" % ",".join("?" * len(note_ids))
+            args.extend(note_ids)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY day, added_at", args).fetchall()
+        out = []
+        for note_id, enc, d, payload in rows:
+            data = json.loads(payload)
+            out.append({
+                "note_id": note_id,
+                "encounter_id": enc,
+                "day": d,
+                "bullets": data["bullets"],
+                "id_to_sentence": {int(k): v for k, v in data["id_to_sentence"].items()},
+            })
+        return out
+
+    def rollups(self, patient_id: str, level: str, encounter_id: Optional[str] = None,
+                dirty_only: bool = False) -> List[Dict[str, Any]]:
+        sql = ("SELECT encounter_id, day, payload, pending, rebuild, version FROM rollups "
+               "WHERE patient_id = ? AND level = ?")
+        args: List[Any] = [patient_id, level]
+        if encounter_id is not None:
+            sql += " AND encounter_id = ?"
+            args.append(encounter_id)
+        if dirty_only:
+            sql += " AND dirty = 1"
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY encounter_id, day", args).fetchall()
+        return [
+            {"encounter_id": enc, "day": d, "bullets": json.loads(payload), "pending": json.loads(pending),
+             "rebuild": bool(rebuild), "version": version}
+            for enc, d, payload, pending, rebuild, version in rows
+        ]
+
+    def finish_rollup(self, patient_id: str, level: str, row: Dict[str, Any],
+                      bullets: Optional[List[Dict[str, Any]]]) -> bool:
+        """
+        Store a recomputed rollup (None deletes it). Returns False if the row
+        was marked again since it was read; it then stays dirty, keeping only
+        the pending items that arrived after the read.
+        """
+        key = (patient_id, level, row["encounter_id"], row["day"])
+        where = "WHERE patient_id = ? AND level = ? AND encounter_id = ? AND day = ?"
+        with self._lock:
+            cur = self._conn.execute(f"SELECT pending, version FROM rollups {where}", key).fetchone()
+            if cur is None:
+                return True
+            current = cur[1] == row["version"]
+            if bullets is None and current:
+                self._conn.execute(f"DELETE FROM rollups {where}", key)
+            elif current:
+                self._conn.execute(
+                    f"UPDATE rollups SET payload = ?, pending = '[]', rebuild = 0, dirty = 0 {where}",
+                    (json.dumps(bullets), *key),
+                )
+            else:
+                remaining = [p for p in json.loads(cur[0]) if p not in row["pending"]]
+                self._conn.execute(
+                    f"UPDATE rollups SET payload = ?, pending = ? {where}",
+                    (json.dumps(bullets or []), json.dumps(remaining), *key),
+                )
+            self._conn.commit()
+        return current
+
+
+_store = None
+_store_lock = threading.Lock()
+
+# Striped per-patient locks so two refreshes don't fold the same pending items twice
+_PATIENT_LOCKS = [threading.Lock() for _ in range(64)]
+
+
+def get_timeline_store() -> TimelineStore:
+    """
+    Process-wide timeline store. MEDSCRIBE_TIMELINE_DB sets a SQLite path
+    (in-memory if unset).
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TimelineStore(os.getenv("MEDSCRIBE_TIMELINE_DB", "") or ":memory:")
+        return _store
+
+
+def _note_items(note: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "text": b.get("text", ""),
+            "citations": [{"note_id": note["note_id"], "sentence_id": int(c)} for c in b.get("citations") or []],
+        }
+        for b in note["bullets"]
+    ]
+
+
+def _build_rollup_prompt(label: str, items: List[Dict[str, Any]]) -> str:
+    numbered = "\n".join(f"{i}. {it['text']}" for i, it in enumerate(items, start=1))
+    return (
+        "You are an expert medical scribe. Condense the numbered FACTS about one patient "
+        f"({label}) into 3-7 non-redundant bullets. Merge duplicates, keep the clinical "
+        "course in time order, and do not add information not present in the FACTS.\n"
+        "Return ONLY valid JSON: {\"bullets\": [ { \"text\": str, \"citations\": [int] } ]} "
+        "where citations are the FACT numbers supporting each bullet.\n\n"
+        "FACTS:\n" + numbered + "\n"
+    )
+
+
+def rollup_items(label: str, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Condense {"text", "citations"} items into rollup bullets; each bullet
+    carries the citations of the items it cites. Returns {"bullets", "generated"}.
+    """
+    if len(items) <= _PASS_THROUGH_MAX or not has_live_provider():
+        return {"bullets": items, "generated": False}
+
+    from .watsonx_summarizer import _extract_json
+
+    try:
+        content, _ = run_generation(_build_rollup_prompt(label, items), rollup_profile(len(items)))
+        payload = _extract_json(content)
+    except Exception:
+        # Keep the timeline usable (lossless) if the model is unavailable
+        return {"bullets": items, "generated": False}
+
+    out = []
+    for b in payload.get("bullets") or []:
+        text = (b or {}).get("text", "")
+        cited = [items[int(c) - 1] for c in (b or {}).get("citations") or []
+                 if str(c).isdigit() and 1 <= int(c) <= len(items)]
+        score = max((jaccard_similarity(text, it["text"]) for it in cited), default=0.0)
+        if score < _SUPPORT_THRESHOLD:
+            continue
+        refs = []
+        for it in cited:
+            for ref in it["citations"]:
+                if ref not in refs:
+                    refs.append(ref)
+        out.append({"text": text, "citations": refs, "support_score": score})
+    return {"bullets": out or items, "generated": bool(out)}
+
+
+def add_note(
+    patient_id: str,
+    note_id: str,
+    validated: Dict[str, Any],
+    *,
+    encounter_id: Optional[str] = None,
+    day: Optional[str] = None,
+) -> None:
+    """Store a note's validated bullets and sentence index, marking its day/encounter dirty."""
+    if "summary_bullets" not in validated:
+        # e.g. the mock response used without a model provider
+        raise ValueError("timeline requires a live analysis with summary_bullets; configure a model provider")
+    get_timeline_store().put_note(
+        patient_id,
+        note_id,
+        str(encounter_id or "default"),
+        str(day or datetime.date.today().isoformat()),
+        validated.get("summary_bullets") or [],
+        validated.get("id_to_sentence") or {},
+    )
+
+
+def _refresh_day(store: TimelineStore, patient_id: str, row: Dict[str, Any]) -> int:
+    enc, day = row["encounter_id"], row["day"]
+    if row["rebuild"] or not row["bullets"]:
+        notes = store.notes(patient_id, encounter_id=enc, day=day)
+        if not notes:
+            store.finish_rollup(patient_id, "day", row, None)
+            return 0
+        items = [it for n in notes for it in _note_items(n)]
+    else:
+        # Fold only the new notes into the previous day rollup
+        new_notes = store.notes(patient_id, encounter_id=enc, day=day, note_ids=row["pending"])
+        items = row["bullets"] + [it for n in new_notes for it in _note_items(n)]
+    result = rollup_items(f"encounter {enc}, {day}", items)
+    store.finish_rollup(patient_id, "day", row, result["bullets"])
+    return int(result["generated"])
+
+
+def _refresh_encounter(store: TimelineStore, patient_id: str, row: Dict[str, Any]) -> int:
+    enc = row["encounter_id"]
+    days = {d["day"]: d["bullets"] for d in store.rollups(patient_id, "day", encounter_id=enc)}
+    if not days:
+        store.finish_rollup(patient_id, "encounter", row, None)
+        return 0
+    if len(days) == 1:
+        # Single-day encounter: the day rollup is the encounter rollup
+        store.finish_rollup(patient_id, "encounter", row, next(iter(days.values())))
+        return 0
+    if row["rebuild"] or not row["bullets"]:
+        items = [it for d in sorted(days) for it in days[d]]
+    else:
+        # Fold only the new notes into the previous encounter rollup
+        new_notes = store.notes(patient_id, encounter_id=enc, note_ids=row["pending"])
+        items = row["bullets"] + [it for n in new_notes for it in _note_items(n)]
+    result = rollup_items(f"encounter {enc}", items)
+    store.finish_rollup(patient_id, "encounter", row, result["bullets"])
+    return int(result["generated"])
+
+
+def refresh_rollups(patient_id: str) -> Dict[str, int]:
+    """
+    Recompute only dirty rollups: days first, then the encounters above them.
+    Returns counts of recomputed levels and model generations used.
+    """
+    store = get_timeline_store()
+    stats = {"days": 0, "encounters": 0, "generations": 0}
+    with _PATIENT_LOCKS[hash(patient_id) % len(_PATIENT_LOCKS)]:
+        for row in store.rollups(patient_id, "day", dirty_only=True):
+            stats["generations"] += _refresh_day(store, patient_id, row)
+            stats["days"] += 1
+        for row in store.rollups(patient_id, "encounter", dirty_only=True):
+            stats["generations"] += _refresh_encounter(store, patient_id, row)
+            stats["encounters"] += 1
+    return stats
+
+
+def get_timeline(patient_id: str) -> Dict[str, Any]:
+    store = get_timeline_store()
+    notes = store.notes(patient_id)
+    encounters: Dict[str, Dict[str, Any]] = {}
+    for row in store.rollups(patient_id, "encounter"):
+        enc = row["encounter_id"]
+        encounters[enc] = {"encounter_id": enc, "summary_bullets": row["bullets"], "days": []}
+    for row in store.rollups(patient_id, "day"):
+        enc, day = row["encounter_id"], row["day"]
+        if enc in encounters:
+            encounters[enc]["days"].append({
+                "day": day,
+                "summary_bullets": row["bullets"],
+                "note_ids": [n["note_id"] for n in notes if n["encounter_id"] == enc and n["day"] == day],
+            })
+    return {
+        "patient_id": patient_id,
+        "encounters": list(encounters.values()),
+        # Resolves (note_id, sentence_id) citations at every level
+        "notes": {n["note_id"]: {"day": n["day"], "encounter_id": n["encounter_id"],
+                                 "id_to_sentence": n["id_to_sentence"]} for n in notes},
+    }
@@ -0,0 +1,312 @@
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+try:
+    import fcntl  # type: ignore
+except Exception:  # pragma: no cover - not available on Windows
+    fcntl = None  # type: ignore
+
+_LEN = struct.Struct("<I")
+_DATA_FILE = "records.bin"
+_INDEX_FILE = "index.tsv"
+
+MODES = ("off", "record", "replay", "replay_or_record")
+
+
+def cassette_mode() -> str:
+    """
+    MEDSCRIBE_CASSETTE_MODE: off (default), record, replay or replay_or_record.
+    MEDSCRIBE_CASSETTE_PATH selects the store directory; MEDSCRIBE_CASSETTE_MODEL
+    names the recorded model when replaying without that provider configured.
+    """
+    mode = os.getenv("MEDSCRIBE_CASSETTE_MODE", "off").strip().lower()
+    return mode if mode in MODES else "off"
+
+
+def _sha(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def cassette_key(prompt: str, model: str, params: Dict[str, Any]) -> str:
+    """Key for one generation: (prompt hash, model, params)."""
+    return _sha(_sha(prompt) + "\0" + model + "\0" + json.dumps(params, sort_keys=True))
+
+
+def note_key(meta: Optional[Dict[str, Any]]) -> str:
+    """Prompt-independent key for a note's call (used by loose replay after prompt edits)."""
+    if not meta or not meta.get("note_text"):
+        return ""
+    return _sha(json.dumps([meta.get("kind"), meta["note_text"], meta.get("style")]))
+
+
+class CassetteStore:
+    """
+    Append-only store of recorded completions in a directory:
+      - records.bin: length-prefixed, zlib-compressed JSON records
+      - index.tsv: "key<TAB>note_key<TAB>offset<TAB>length" per record
+
+    The index is loaded into memory on open; refresh() picks up index lines
+    appended by other processes since. Records missing from the index after a
+    crash are recovered by scanning the data file past the last indexed
+    offset, stopping at the first torn or corrupt record.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._data_path = os.path.join(path, _DATA_FILE)
+        self._index_path = os.path.join(path, _INDEX_FILE)
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, Tuple[int, int]] = {}
+        self._by_note: Dict[str, Tuple[int, int]] = {}
+        self._indexed_end = 0
+        self._index_pos = 0
+        self._load_index()
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._by_key
+
+    def _remember(self, key: str, nkey: str, offset: int, length: int) -> None:
+        self._by_key[key] = (offset, length)
+        if nkey:
+            self._by_note[nkey] = (offset, length)
+        self._indexed_end = max(self._indexed_end, offset + length)
+
+    def _load_index(self) -> None:
+        if os.path.exists(self._index_path):
+            with open(self._index_path, "rb") as fh:
+                fh.seek(self._index_pos)
+                for line in fh:
+                    if not line.endswith(b"\n"):
+                        break  # partially written line; re-read on the next refresh
+                    self._index_pos += len(line)
+                    parts = line.decode("utf-8").rstrip("\n").split("\t")
+                    if len(parts) == 4:
+                        self._remember(parts[0], parts[1], int(parts[2]), int(parts[3]))
+        self._scan_tail()
+
+    def _scan_tail(self) -> None:
+        if not os.path.exists(self._data_path):
+            return
+        with open(self._data_path, "rb") as fh:
+            fh.seek(self._indexed_end)
+            offset = self._indexed_end
+            while True:
+                head = fh.read(_LEN.size)
+                if len(head) < _LEN.size:
+                    break
+                (size,) = _LEN.unpack(head)
+                blob = fh.read(size)
+                if len(blob) < size:
+                    break  # torn write at the tail (e.g. crash mid-append)
+                try:
+                    rec = json.loads(zlib.decompress(blob))
+                    key, nkey = rec["key"], rec.get("note_key", "")
+                except (zlib.error, ValueError, KeyError, TypeError, AttributeError):
+                    break  # corrupt record: keep what was recovered so far
+                self._remember(key, nkey, offset, _LEN.size + size)
+                offset += _LEN.size + size
+
+    def append(
+        self,
+        key: str,
+        *,
+        model: str,
+        params: Dict[str, Any],
+        prompt: str,
+        completion: str,
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        nkey = note_key(meta)
+        rec = {
+            "key": key,
+            "note_key": nkey,
+            "model": model,
+            "params": params,
+            "prompt_sha": _sha(prompt),
+            "completion": completion,
+            "meta": meta or {},
+            "recorded_at": time.time(),
+        }
+        blob = zlib.compress(json.dumps(rec).encode("utf-8"), 6)
+        with self._lock, open(self._data_path, "ab") as data:
+            if fcntl is not None:
+                fcntl.flock(data, fcntl.LOCK_EX)
+            try:
+                offset = data.seek(0, os.SEEK_END)
+                data.write(_LEN.pack(len(blob)) + blob)
+                data.flush()
+                length = _LEN.size + len(blob)
+                with open(self._index_path, "a", encoding="utf-8") as index:
+                    index.write(f"{key}\t{nkey}\t{offset}\t{length}\n")
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(data, fcntl.LOCK_UN)
+            self._remember(key, nkey, offset, length)
+
+    def _read(self, loc: Tuple[int, int]) -> Dict[str, Any]:
+        offset, length = loc
+        with open(self._data_path, "rb") as fh:
+            fh.seek(offset + _LEN.size)
+            return json.loads(zlib.decompress(fh.read(length - _LEN.size)))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        loc = self._by_key.get(key)
+        return self._read(loc) if loc else None
+
+    def get_by_note(self, nkey: str) -> Optional[Dict[str, Any]]:
+        loc = self._by_note.get(nkey)
+        return self._read(loc) if loc else None
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """Latest record per key, in file order."""
+        for loc in sorted(set(self._by_key.values())):
+            yield self._read(loc)
+
+    def refresh(self) -> None:
+        """Pick up records appended by other processes since the last load."""
+        with self._lock:
+            self._load_index()
+
+
+_store: Optional[CassetteStore] = None
+_store_lock = threading.Lock()
+
+
+def get_cassette_store() -> Optional[CassetteStore]:
+    """Process-wide store at MEDSCRIBE_CASSETTE_PATH (None when unset)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            path = os.getenv("MEDSCRIBE_CASSETTE_PATH", "")
+            if path:
+                _store = CassetteStore(path)
+        return _store
+
+
+class ResponseCache:
+    """Small thread-safe LRU of completions keyed by cassette_key."""
+
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self._items: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key: str, value: str) -> None:
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+# Off unless MEDSCRIBE_RESPONSE_CACHE_SIZE is set: identical prompts are then served from memory
+response_cache = ResponseCache(int(os.getenv("MEDSCRIBE_RESPONSE_CACHE_SIZE", "0")))
+
+
+def warm_response_cache(store: CassetteStore, limit: Optional[int] = None) -> int:
+    """Load the most recent recorded completions into the response cache (e.g. on deploy)."""
+    limit = response_cache.max_items if limit is None else limit
+    recs = sorted(store.records(), key=lambda r: r.get("recorded_at", 0))[-limit:] if limit > 0 else []
+    for rec in recs:
+        response_cache.put(rec["key"], rec["completion"])
+    return len(recs)
+
+
+def replay_notes(store: CassetteStore, loose: bool = False) -> Dict[str, Any]:
+    """
+    Re-run every recorded citation call through the current prompt builder,
+    JSON parsing and validate_outputs, offline.
+
+    An exact hit means the current _build_citation_prompt produced the recorded
+    prompt. With loose=True, prompt misses fall back to the completion recorded
+    for the same note, which still exercises parsing and validation.
+    """
+    from ..watsonx_summarizer import _build_citation_prompt, _extract_json
+    from .text_index import index_sentences
+    from .validation import validate_outputs
+
+    # A note re-recorded after a prompt edit has several keys; replay only its latest record
+    latest: Dict[str, Dict[str, Any]] = {}
+    for rec in store.records():
+        latest[rec.get("note_key") or rec["key"]] = rec
+
+    stats = {
+        "notes": 0, "exact_hits": 0, "loose_hits": 0, "misses": 0, "parse_errors": 0,
+        "bullets_kept": 0, "bullets_dropped": 0, "orders_kept": 0, "orders_dropped": 0,
+        "miss_note_keys": [],
+    }
+    started = time.perf_counter()
+    for rec in latest.values():
+        meta = rec.get("meta") or {}
+        if meta.get("kind") != "citation":
+            continue
+        stats["notes"] += 1
+        pairs = [(int(i), s) for i, s in meta.get("numbered_sentences") or []]
+        prompt = _build_citation_prompt(meta["note_text"], pairs, meta.get("style"))
+        # Batched windows share one (largest-window) profile, so key on the recorded params
+        hit = store.get(cassette_key(prompt, rec["model"], rec["params"]))
+        if hit is not None:
+            stats["exact_hits"] += 1
+        elif loose:
+            hit = rec
+            stats["loose_hits"] += 1
+        else:
+            stats["misses"] += 1
+            stats["miss_note_keys"].append(rec.get("note_key", ""))
+            continue
+        try:
+            payload = _extract_json(hit["completion"])
+        except ValueError:
+            stats["parse_errors"] += 1
+            continue
+        validated = validate_outputs(payload, index_sentences(pairs), threshold=0.30, annotate_codes=False)
+        stats["bullets_kept"] += len(validated["summary_bullets"])
+        stats["bullets_dropped"] += len(payload.get("summary_bullets") or []) - len(validated["summary_bullets"])
+        stats["orders_kept"] += len(validated["suggested_orders"])
+        stats["orders_dropped"] += len(payload.get("suggested_orders") or []) - len(validated["suggested_orders"])
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or replay a recorded LLM cassette store")
+    parser.add_argument("path", help="Cassette directory (MEDSCRIBE_CASSETTE_PATH)")
+    parser.add_argument("command", choices=["stats", "replay"], help="stats: record counts; replay: offline regression")
+    parser.add_argument("--loose", action="store_true", help="On prompt mismatch, reuse the note's recorded completion")
+
+    args = parser.parse_args()
+    try:
+        store = CassetteStore(args.path)
+        if args.command == "stats":
+            print(json.dumps({"records": len(store), "bytes": os.path.getsize(store._data_path) if len(store) else 0}))
+        else:
+            print(json.dumps(replay_notes(store, loose=args.loose), indent=2))
+    except Exception as exc:  # pragma: no cover - CLI convenience
+        sys.stderr.write(f"[error] {exc}\n")
+        sys.exit(1)
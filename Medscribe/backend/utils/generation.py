@@ -0,0 +1,228 @@
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+# Rough output sizes (tokens) for the citation JSON schema
+_JSON_OVERHEAD = 40
+_TOKENS_PER_BULLET = 35
+_TOKENS_PER_ORDER = 90
+_HEADROOM = 1.25
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough heuristic (~4 chars/token) that is good enough for budgeting prompts
+    return max(1, len(text or "") // 4)
+
+
+def base_params() -> Dict[str, Any]:
+    return {
+        "decoding_method": "greedy",
+        "max_new_tokens": _max_cap(),
+        "temperature": 0.2,
+        "repetition_penalty": 1.05,
+    }
+
+
+def _max_cap() -> int:
+    return int(os.getenv("WATSONX_MAX_NEW_TOKENS", "1024"))
+
+
+def _budget(expected: int, floor: int) -> int:
+    return max(floor, min(_max_cap(), int(expected * _HEADROOM)))
+
+
+def citation_profile(numbered_sentences: List[Any]) -> Dict[str, Any]:
+    """
+    Profile for the citation JSON call. Bullet/order counts follow the prompt's
+    limits (3-7 bullets, 2-4 orders), scaled by how many sentences can be cited.
+    """
+    n = len(numbered_sentences or [])
+    bullets = min(7, max(3, n))
+    orders = min(4, max(2, n // 2))
+    expected = _JSON_OVERHEAD + bullets * _TOKENS_PER_BULLET + orders * _TOKENS_PER_ORDER
+    params = base_params()
+    params.update({
+        "max_new_tokens": _budget(expected, 256),
+        "stop_sequences": ["\n\n\n"],
+        "include_stop_sequence": False,
+    })
+    return {"name": "citation_json", "params": params, "json_early_stop": True}
+
+
+def summary_profile(text: str) -> Dict[str, Any]:
+    # Bullets + short narrative + diagnosis + treatments; grows mildly with input size
+    expected = 300 + estimate_tokens(text) // 8
+    params = base_params()
+    params["max_new_tokens"] = _budget(expected, 256)
+    return {"name": "summary", "params": params, "json_early_stop": False}
+
+
+def chat_profile(prompt: str) -> Dict[str, Any]:
+    expected = 200 + min(estimate_tokens(prompt) // 4, 200)
+    params = base_params()
+    params.update({
+        "max_new_tokens": _budget(expected, 128),
+        # Session prompts are laid out as "User:/Assistant:" turns
+        "stop_sequences": ["\nUser:"],
+        # watsonx appends the matched stop sequence to generated_text by default
+        "include_stop_sequence": False,
+    })
+    return {"name": "chat", "params": params, "json_early_stop": False}
+
+
+def rollup_profile(n_inputs: int) -> Dict[str, Any]:
+    # Rollups condense already-validated bullets, so output is at most ~7 short bullets
+    bullets = min(7, max(3, n_inputs // 2))
+    params = base_params()
+    params.update({
+        "max_new_tokens": _budget(_JSON_OVERHEAD + bullets * _TOKENS_PER_BULLET, 160),
+        "stop_sequences": ["\n\n\n"],
+        "include_stop_sequence": False,
+    })
+    return {"name": "rollup_json", "params": params, "json_early_stop": True}
+
+
+def compaction_profile() -> Dict[str, Any]:
+    params = base_params()
+    params["max_new_tokens"] = 200
+    return {"name": "compaction", "params": params, "json_early_stop": False}
+
+
+class _JsonBalanceTracker:
+    """Incrementally tracks whether the first top-level JSON object is closed."""
+
+    def __init__(self) -> None:
+        self.depth = 0
+        self.started = False
+        self.in_str = False
+        self.esc = False
+
+    def feed(self, chunk: str) -> int:
+        """Return the index just past the closing brace, or -1 if not yet balanced."""
+        for i, ch in enumerate(chunk):
+            if self.in_str:
+                if self.esc:
+                    self.esc = False
+                elif ch == '\\':
+                    self.esc = True
+                elif ch == '"':
+                    self.in_str = False
+                continue
+            if not self.started:
+                if ch == '{':
+                    self.started = True
+                    self.depth = 1
+                continue
+            if ch == '"':
+                self.in_str = True
+            elif ch == '{':
+                self.depth += 1
+            elif ch == '}':
+                self.depth -= 1
+                if self.depth == 0:
+                    return i + 1
+        return -1
+
+
+def _chunk_text(chunk: Any) -> str:
+    if isinstance(chunk, dict):
+        items = chunk.get("results") or []
+        return items[0].get("generated_text", "") if items else ""
+    return str(chunk or "")
+
+
+def stream_until_balanced(chunks: Iterable[Any]) -> Dict[str, Any]:
+    tracker = _JsonBalanceTracker()
+    parts: List[str] = []
+    stop_reason = "eos_token"
+    for chunk in chunks:
+        text = _chunk_text(chunk)
+        end = tracker.feed(text)
+        if end >= 0:
+            parts.append(text[:end])
+            stop_reason = "json_balanced"
+            break
+        parts.append(text)
+        if isinstance(chunk, dict):
+            items = chunk.get("results") or []
+            if items and items[0].get("stop_reason") not in (None, "not_finished"):
+                stop_reason = items[0]["stop_reason"]
+    close = getattr(chunks, "close", None)
+    if close is not None:
+        # Closing the generator drops the HTTP stream so no more tokens are paid for
+        try:
+            close()
+        except Exception:
+            pass
+    return {"text": "".join(parts), "stop_reason": stop_reason}
+
+
+def strip_stop_sequence(text: str, profile: Dict[str, Any]) -> str:
+    """Drop a trailing stop sequence in case the backend echoed it."""
+    for stop in profile["params"].get("stop_sequences") or []:
+        if stop.strip() and text.endswith(stop.strip()):
+            return text[:-len(stop.strip())].rstrip()
+    return text
+
+
+def generate_with_profile(model, prompt: str, profile: Dict[str, Any]) -> str:
+    """
+    Run model.generate with the profile's params and record budget statistics.
+    For JSON profiles, stream and stop as soon as the top-level object closes.
+    """
+    params = profile["params"]
+    stream = getattr(model, "generate_text_stream", None)
+    if profile.get("json_early_stop") and stream is not None:
+        try:
+            out = stream_until_balanced(stream(prompt=prompt, params=params, raw_response=True))
+            text, stop_reason = out["text"].strip(), out["stop_reason"]
+            record_usage(profile, estimate_tokens(text), stop_reason)
+            return text
+        except Exception:
+            pass  # fall back to the blocking call
+
+    result = model.generate(prompt=prompt, params=params)
+    if isinstance(result, dict):
+        items = result.get("results") or []
+        first = items[0] if items else {}
+        text = strip_stop_sequence((first.get("generated_text", "") or "").strip(), profile)
+        used = first.get("generated_token_count") or estimate_tokens(text)
+        record_usage(profile, int(used), first.get("stop_reason") or "unknown")
+        return text
+    text = strip_stop_sequence(str(result).strip(), profile)
+    record_usage(profile, estimate_tokens(text), "unknown")
+    return text
+
+
+_stats: Dict[str, Dict[str, Any]] = {}
+_stats_lock = threading.Lock()
+
+
+def record_usage(profile: Dict[str, Any], used_tokens: int, stop_reason: str) -> None:
+    budget = int(profile["params"].get("max_new_tokens", 0))
+    with _stats_lock:
+        s = _stats.setdefault(profile["name"], {
+            "calls": 0,
+            "budget_tokens": 0,
+            "used_tokens": 0,
+            "truncated": 0,
+            "early_stopped": 0,
+            "cache_hits": 0,
+        })
+        s["calls"] += 1
+        s["budget_tokens"] += budget
+        s["used_tokens"] += used_tokens
+        if stop_reason == "max_tokens":
+            s["truncated"] += 1
+        elif stop_reason == "json_balanced":
+            s["early_stopped"] += 1
+        elif stop_reason == "cache_hit":
+            s["cache_hits"] += 1
+
+
+def generation_stats(name: Optional[str] = None) -> Dict[str, Any]:
+    """Budget-vs-usage counters per profile (all profiles if name is None)."""
+    with _stats_lock:
+        if name is not None:
+            return dict(_stats.get(name) or {})
+        return {k: dict(v) for k, v in _stats.items()}
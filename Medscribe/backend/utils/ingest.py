@@ -0,0 +1,170 @@
+import codecs
+import json
+import os
+import tempfile
+from typing import IO, Iterable, Iterator, List, Tuple
+
+from .text_index import SENT_SPLIT
+
+_READ_CHUNK = 64 * 1024
+# A "sentence" with no punctuation/newlines (common in OCR output) is cut here
+_MAX_SENTENCE_CHARS = 2000
+
+
+class IngestLimitError(ValueError):
+    pass
+
+
+def ingest_limits() -> dict:
+    """
+    Limits for streamed documents. Environment variables:
+      - MEDSCRIBE_MAX_NOTE_BYTES (default 8 MiB)
+      - MEDSCRIBE_MAX_SENTENCES (default 2000)
+      - MEDSCRIBE_SPOOL_BYTES (in-memory spool size before spilling to disk, default 1 MiB)
+      - MEDSCRIBE_WINDOW_SENTENCES (sentences per model call, default 60)
+      - MEDSCRIBE_MAX_WINDOWS (model calls per document; default enough windows
+        for max_sentences, see window_size)
+    """
+    window_sentences = max(1, int(os.getenv("MEDSCRIBE_WINDOW_SENTENCES", "60")))
+    max_sentences = int(os.getenv("MEDSCRIBE_MAX_SENTENCES", "2000"))
+    max_windows = int(os.getenv("MEDSCRIBE_MAX_WINDOWS", "0")) or -(-max_sentences // window_sentences)
+    return {
+        "max_bytes": int(os.getenv("MEDSCRIBE_MAX_NOTE_BYTES", str(8 * 1024 * 1024))),
+        "max_sentences": max_sentences,
+        "spool_bytes": int(os.getenv("MEDSCRIBE_SPOOL_BYTES", str(1024 * 1024))),
+        "window_sentences": window_sentences,
+        "max_windows": max(1, max_windows),
+    }
+
+
+def window_size(sentence_count: int, limits: dict) -> int:
+    """
+    Sentences per model call for a document: window_sentences, widened only
+    when the document would otherwise need more than max_windows calls.
+    """
+    return max(limits["window_sentences"], -(-sentence_count // limits["max_windows"]))
+
+
+def iter_bytes(stream: IO[bytes], max_bytes: int, chunk_size: int = _READ_CHUNK) -> Iterator[bytes]:
+    """Read a byte stream in chunks, failing as soon as max_bytes is exceeded."""
+    total = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        total += len(chunk)
+        if total > max_bytes:
+            raise IngestLimitError(f"document exceeds {max_bytes} bytes")
+        yield chunk
+
+
+def iter_text(chunks: Iterable[bytes]) -> Iterator[str]:
+    # Incremental decoder so multi-byte characters split across chunks survive
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def iter_ndjson_text(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Yield the text of each NDJSON record ({"text": ...} or {"note_text": ...}), one per line."""
+    buf = b""
+    for chunk in chunks:
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            text = _ndjson_line_text(line)
+            if text:
+                yield text + "\n"
+        if len(buf) > _MAX_SENTENCE_CHARS * 64:
+            raise IngestLimitError("NDJSON record too large")
+    text = _ndjson_line_text(buf)
+    if text:
+        yield text + "\n"
+
+
+def _ndjson_line_text(line: bytes) -> str:
+    line = line.strip()
+    if not line:
+        return ""
+    try:
+        rec = json.loads(line)
+    except Exception as exc:
+        raise ValueError(f"invalid NDJSON line: {exc}") from None
+    if isinstance(rec, str):
+        return rec
+    return str((rec or {}).get("text") or (rec or {}).get("note_text") or "")
+
+
+def iter_sentences(texts: Iterable[str]) -> Iterator[str]:
+    """
+    Incremental equivalent of split_into_sentences: only the trailing, possibly
+    incomplete segment is buffered between chunks.
+    """
+    buf = ""
+    for text in texts:
+        buf += text
+        parts = SENT_SPLIT.split(buf)
+        buf = parts.pop()
+        for part in parts:
+            yield from _emit(part)
+        while len(buf) > _MAX_SENTENCE_CHARS:
+            yield from _emit(buf[:_MAX_SENTENCE_CHARS])
+            buf = buf[_MAX_SENTENCE_CHARS:]
+    yield from _emit(buf)
+
+
+def _emit(part: str) -> Iterator[str]:
+    part = part.strip()
+    if part:
+        yield part
+
+
+class SentenceSpool:
+    """
+    Numbered sentences spooled to memory, spilling to a temp file beyond
+    spool_bytes. Sentences are stored one per line (they never contain newlines).
+    """
+
+    def __init__(self, spool_bytes: int, max_sentences: int):
+        self.max_sentences = max_sentences
+        self.count = 0
+        self.chars = 0
+        self._file = tempfile.SpooledTemporaryFile(max_size=spool_bytes, mode="w+", encoding="utf-8")
+
+    def __enter__(self) -> "SentenceSpool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._file.close()
+
+    @property
+    def spilled(self) -> bool:
+        return bool(getattr(self._file, "_rolled", False))
+
+    def extend(self, sentences: Iterable[str]) -> None:
+        for s in sentences:
+            if self.count >= self.max_sentences:
+                raise IngestLimitError(f"document exceeds {self.max_sentences} sentences")
+            self._file.write(s.replace("\r", " ") + "\n")
+            self.count += 1
+            self.chars += len(s)
+
+    def windows(self, size: int) -> Iterator[List[Tuple[int, str]]]:
+        """Yield lists of (sentence_id, sentence) with at most size items each."""
+        self._file.seek(0)
+        window: List[Tuple[int, str]] = []
+        for i, line in enumerate(self._file, start=1):
+            window.append((i, line.rstrip("\n")))
+            if len(window) >= size:
+                yield window
+                window = []
+        if window:
+            yield window
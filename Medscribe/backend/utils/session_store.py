@@ -0,0 +1,191 @@
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .generation import estimate_tokens
+
+_DEFAULT_TTL_SECONDS = 60 * 60
+_DEFAULT_TURN_BUDGET = 1200
+_MAX_SUMMARY_CHARS = 2000
+
+
+def new_session_state() -> Dict[str, Any]:
+    return {
+        "summary": "",
+        "turns": [],
+        "id_to_sentence": {},
+        "updated_at": time.time(),
+    }
+
+
+def attach_note(state: Dict[str, Any], id_to_sentence: Dict[int, str]) -> bool:
+    """
+    Attach a note's sentence index to the session once. Returns True if attached.
+    """
+    if state.get("id_to_sentence") or not id_to_sentence:
+        return False
+    state["id_to_sentence"] = {int(k): v for k, v in id_to_sentence.items()}
+    return True
+
+
+def append_turn(state: Dict[str, Any], role: str, content: str) -> None:
+    state.setdefault("turns", []).append({"role": role, "content": (content or "").strip()})
+    state["updated_at"] = time.time()
+
+
+def _fallback_summarize(previous: str, turns: List[Dict[str, str]]) -> str:
+    lines = [previous] if previous else []
+    for t in turns:
+        lines.append(f"{t['role']}: {t['content'][:200]}")
+    return "\n".join(lines)
+
+
+def compact_session(
+    state: Dict[str, Any],
+    budget_tokens: int = _DEFAULT_TURN_BUDGET,
+    summarize: Optional[Callable[[str, List[Dict[str, str]]], str]] = None,
+) -> int:
+    """
+    Fold the oldest turns into the running summary until the remaining window
+    fits in budget_tokens. The most recent turn is always kept verbatim.
+    Returns the number of turns compacted.
+    """
+    turns = state.get("turns") or []
+    total = sum(estimate_tokens(t["content"]) for t in turns)
+    cut = 0
+    while total > budget_tokens and cut < len(turns) - 1:
+        total -= estimate_tokens(turns[cut]["content"])
+        cut += 1
+    if not cut:
+        return 0
+
+    old, state["turns"] = turns[:cut], turns[cut:]
+    previous = state.get("summary", "")
+    summary = ""
+    if summarize is not None:
+        try:
+            summary = (summarize(previous, old) or "").strip()
+        except Exception:
+            summary = ""
+    if not summary:
+        summary = _fallback_summarize(previous, old)
+    # Keep the tail: the newest compacted context matters most
+    state["summary"] = summary[-_MAX_SUMMARY_CHARS:]
+    return cut
+
+
+class InMemorySessionStore:
+    def __init__(self, ttl_seconds: float = _DEFAULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Dict[str, Any]:
+        with self._lock:
+            self._evict_expired_locked()
+            state = self._sessions.get(session_id)
+            return copy.deepcopy(state) if state else new_session_state()
+
+    def save(self, session_id: str, state: Dict[str, Any]) -> None:
+        state["updated_at"] = time.time()
+        with self._lock:
+            self._sessions[session_id] = copy.deepcopy(state)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def evict_expired(self) -> int:
+        with self._lock:
+            return self._evict_expired_locked()
+
+    def _evict_expired_locked(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        expired = [k for k, v in self._sessions.items() if v.get("updated_at", 0) < cutoff]
+        for k in expired:
+            del self._sessions[k]
+        return len(expired)
+
+
+class SQLiteSessionStore:
+    def __init__(self, path: str, ttl_seconds: float = _DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY,"
+            " state TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, session_id: str) -> Dict[str, Any]:
+        with self._lock:
+            self._evict_expired_locked()
+            row = self._conn.execute(
+                "SELECT state FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if not row:
+            return new_session_state()
+        state = json.loads(row[0])
+        # JSON turns int keys into strings
+        state["id_to_sentence"] = {int(k): v for k, v in (state.get("id_to_sentence") or {}).items()}
+        return state
+
+    def save(self, session_id: str, state: Dict[str, Any]) -> None:
+        state["updated_at"] = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, state, updated_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(state), state["updated_at"]),
+            )
+            self._conn.commit()
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def evict_expired(self) -> int:
+        with self._lock:
+            return self._evict_expired_locked()
+
+    def _evict_expired_locked(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        cur = self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+        self._conn.commit()
+        return cur.rowcount
+
+
+# Striped locks serialize turns within a session (bounded memory, in-process only)
+_SESSION_LOCKS = [threading.Lock() for _ in range(64)]
+
+
+def session_lock(session_id: str) -> threading.Lock:
+    """Lock to hold across get -> generate -> save for one session."""
+    return _SESSION_LOCKS[hash(session_id) % len(_SESSION_LOCKS)]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """
+    Process-wide session store. Configure via environment:
+      - MEDSCRIBE_SESSION_DB (optional; SQLite path, in-memory store if unset)
+      - MEDSCRIBE_SESSION_TTL (optional; seconds, default 3600)
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            ttl = float(os.getenv("MEDSCRIBE_SESSION_TTL", str(_DEFAULT_TTL_SECONDS)))
+            db_path = os.getenv("MEDSCRIBE_SESSION_DB", "")
+            _store = SQLiteSessionStore(db_path, ttl) if db_path else InMemorySessionStore(ttl)
+        return _store
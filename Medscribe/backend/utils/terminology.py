@@ -0,0 +1,497 @@
+import csv
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+_MAGIC = b"MSTERM1\0"
+_HEAD = struct.Struct("<8sI")
+_VOCAB = struct.Struct("<II")            # string offset, length
+_ENTRY = struct.Struct("<IIIIIIII")      # term, code, system, display (offset, length each)
+_NODE = struct.Struct("<iiiII")          # fail, out_entry, dict_link, trans_start, trans_count
+_TRANS = struct.Struct("<II")            # token_id, child
+_FUZZY = struct.Struct("<III")           # token_id, string offset, length; sorted by _fuzzy_key
+# Upper bound on candidates compared per (prefix, length) bucket
+_FUZZY_BUCKET_SCAN = 128
+_TOKEN_CACHE_SIZE = 8192
+
+# Order type -> catalogs its codes may come from (all catalogs for other types)
+ORDER_TYPE_SYSTEMS = {
+    "lab": ("LOINC",),
+    "medication": ("RxNorm",),
+    "imaging": ("CPT", "LOINC"),
+    "consult": ("CPT",),
+}
+
+# Matches below this score are not attached to orders
+MIN_MATCH_SCORE = 0.55
+_SINGLE_TOKEN_PENALTY = 0.6
+
+_SYSTEM_HINTS = (("loinc", "LOINC"), ("rxnorm", "RxNorm"), ("cpt", "CPT"))
+
+
+def normalize(text: str) -> List[str]:
+    return _TOKEN.findall((text or "").lower())
+
+
+def _levenshtein(a: str, b: str, cap: int) -> int:
+    """Edit distance, or cap + 1 once it is known to exceed cap."""
+    # Strip the common prefix/suffix, then branch on the first mismatch (3**cap paths at most)
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    j = 0
+    while j < n - i and a[-1 - j] == b[-1 - j]:
+        j += 1
+    a, b = a[i:len(a) - j], b[i:len(b) - j]
+    if not a or not b:
+        return len(a) + len(b) if len(a) + len(b) <= cap else cap + 1
+    if cap == 0 or abs(len(a) - len(b)) > cap:
+        return cap + 1
+    if cap == 1:
+        # Both ends already differ, so one edit only works on single characters
+        return 1 if len(a) == 1 and len(b) == 1 else 2
+    best = cap + 1
+    for x, y in ((a[1:], b[1:]), (a[1:], b), (a, b[1:])):
+        best = min(best, 1 + _levenshtein(x, y, cap - 1))
+        if best == 1:
+            break
+    return best
+
+
+def _fuzzy_key(tok: str) -> Tuple[str, int, str]:
+    # Fuzzy candidates share the first two characters and have a similar length
+    return tok[:2], len(tok), tok
+
+
+# ---------------------------------------------------------------------------
+# Build step
+# ---------------------------------------------------------------------------
+
+def _read_catalog(path: str) -> Iterable[Tuple[str, str, str]]:
+    """
+    Yield (code, display, system) from a CSV/TSV catalog with a header row.
+    Accepted columns: code, display|name|term, system (optional; inferred from
+    the file name when absent, e.g. loinc.csv -> LOINC).
+    """
+    default_system = next((s for hint, s in _SYSTEM_HINTS if hint in os.path.basename(path).lower()), "")
+    with open(path, newline="", encoding="utf-8") as fh:
+        dialect = "excel-tab" if path.endswith((".tsv", ".txt")) else "excel"
+        for row in csv.DictReader(fh, dialect=dialect):
+            row = {(k or "").strip().lower(): (v or "").strip() for k, v in row.items()}
+            code = row.get("code", "")
+            display = row.get("display") or row.get("name") or row.get("term") or ""
+            system = row.get("system") or default_system
+            if code and display:
+                yield code, display, system
+
+
+class _Strings:
+    def __init__(self) -> None:
+        self.blob = bytearray()
+        self._seen: Dict[str, Tuple[int, int]] = {}
+
+    def add(self, s: str) -> Tuple[int, int]:
+        if s not in self._seen:
+            raw = s.encode("utf-8")
+            self._seen[s] = (len(self.blob), len(raw))
+            self.blob += raw
+        return self._seen[s]
+
+
+def build_index(catalog_paths: Sequence[str], out_path: str) -> Dict[str, int]:
+    """
+    Precompile catalogs into a single read-only index file for TerminologyIndex.
+
+    Layout: header, string blob, sorted token vocabulary, token ids bucketed by
+    (first two characters, length) for fuzzy matching, entries sorted by
+    normalized term (binary-searchable prefix index), and a token-level
+    Aho-Corasick automaton (nodes + sorted transitions).
+    """
+    rows = set()
+    for path in catalog_paths:
+        for code, display, system in _read_catalog(path):
+            tokens = normalize(display)
+            if tokens:
+                rows.add((" ".join(tokens), system, code, display))
+    entries = sorted(rows)
+
+    vocab = sorted({t for e in entries for t in e[0].split(" ")})
+    token_id = {t: i for i, t in enumerate(vocab)}
+
+    # Trie over token ids; each term maps to its first entry (duplicates are contiguous)
+    children: List[Dict[int, int]] = [{}]
+    out_entry = [-1]
+    for idx, (term, _, _, _) in enumerate(entries):
+        node = 0
+        for tok in term.split(" "):
+            tid = token_id[tok]
+            nxt = children[node].get(tid)
+            if nxt is None:
+                nxt = len(children)
+                children[node][tid] = nxt
+                children.append({})
+                out_entry.append(-1)
+            node = nxt
+        if out_entry[node] == -1:
+            out_entry[node] = idx
+
+    fail = [0] * len(children)
+    dict_link = [-1] * len(children)
+    queue = deque(children[0].values())
+    while queue:
+        node = queue.popleft()
+        for tid, child in children[node].items():
+            f = fail[node]
+            while f and tid not in children[f]:
+                f = fail[f]
+            fail[child] = children[f].get(tid, 0) if children[f].get(tid, 0) != child else 0
+            target = fail[child]
+            dict_link[child] = target if out_entry[target] >= 0 else dict_link[target]
+            queue.append(child)
+
+    strings = _Strings()
+    vocab_bin = bytearray()
+    for tok in vocab:
+        vocab_bin += _VOCAB.pack(*strings.add(tok))
+    fuzzy_bin = bytearray()
+    for tid in sorted(range(len(vocab)), key=lambda i: _fuzzy_key(vocab[i])):
+        fuzzy_bin += _FUZZY.pack(tid, *strings.add(vocab[tid]))
+    entry_bin = bytearray()
+    for term, system, code, display in entries:
+        entry_bin += _ENTRY.pack(*strings.add(term), *strings.add(code), *strings.add(system), *strings.add(display))
+    node_bin = bytearray()
+    trans_bin = bytearray()
+    n_trans = 0
+    for node, kids in enumerate(children):
+        node_bin += _NODE.pack(fail[node], out_entry[node], dict_link[node], n_trans, len(kids))
+        for tid in sorted(kids):
+            trans_bin += _TRANS.pack(tid, kids[tid])
+            n_trans += 1
+
+    sections = [("strings", strings.blob), ("vocab", vocab_bin), ("fuzzy", fuzzy_bin), ("entries", entry_bin),
+                ("nodes", node_bin), ("trans", trans_bin)]
+    counts = {"vocab": len(vocab), "entries": len(entries), "nodes": len(children), "trans": n_trans}
+    # Offsets are relative to the end of the (variable-length) JSON header
+    offsets, pos = {}, 0
+    for name, data in sections:
+        offsets[name] = pos
+        pos += len(data)
+    header = json.dumps({"offsets": offsets, "counts": counts}).encode("utf-8")
+
+    tmp = out_path + ".tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(_HEAD.pack(_MAGIC, len(header)))
+        fh.write(header)
+        for _, data in sections:
+            fh.write(data)
+    os.replace(tmp, out_path)
+    return counts
+
+
+# ---------------------------------------------------------------------------
+# Lookup
+# ---------------------------------------------------------------------------
+
+class TerminologyIndex:
+    """
+    Read-only view over a compiled index file. The file is memory-mapped, so
+    worker processes share the same physical pages via the OS page cache.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_len = _HEAD.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"Not a terminology index: {path}")
+        header = json.loads(self._mm[_HEAD.size:_HEAD.size + header_len])
+        base = _HEAD.size + header_len
+        self._off = {k: base + v for k, v in header["offsets"].items()}
+        self.counts = header["counts"]
+        # Order names repeat a small working set of tokens, so resolved tokens are memoized
+        self._tokens: Dict[str, Tuple[int, int]] = {}
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def _str(self, off: int, length: int) -> str:
+        start = self._off["strings"] + off
+        return self._mm[start:start + length].decode("utf-8")
+
+    def _vocab(self, i: int) -> str:
+        return self._str(*_VOCAB.unpack_from(self._mm, self._off["vocab"] + i * _VOCAB.size))
+
+    def _term(self, i: int) -> str:
+        off, length = _ENTRY.unpack_from(self._mm, self._off["entries"] + i * _ENTRY.size)[:2]
+        return self._str(off, length)
+
+    def _system(self, i: int) -> str:
+        f = _ENTRY.unpack_from(self._mm, self._off["entries"] + i * _ENTRY.size)
+        return self._str(f[4], f[5])
+
+    def _entry(self, i: int) -> Dict[str, str]:
+        f = _ENTRY.unpack_from(self._mm, self._off["entries"] + i * _ENTRY.size)
+        return {
+            "system": self._str(f[4], f[5]),
+            "code": self._str(f[2], f[3]),
+            "display": self._str(f[6], f[7]),
+        }
+
+    @staticmethod
+    def _lower_bound(n: int, key, target: str) -> int:
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _token_id(self, tok: str) -> Tuple[int, int]:
+        """Return (token_id, edits); token_id is -1 when nothing is close enough."""
+        hit = self._tokens.get(tok)
+        if hit is None:
+            if len(self._tokens) >= _TOKEN_CACHE_SIZE:
+                self._tokens.clear()
+            hit = self._tokens[tok] = self._resolve_token(tok)
+        return hit
+
+    def _resolve_token(self, tok: str) -> Tuple[int, int]:
+        n = self.counts["vocab"]
+        i = self._lower_bound(n, self._vocab, tok)
+        if i < n and self._vocab(i) == tok:
+            return i, 0
+        if len(tok) < 4:
+            return -1, 0
+        # Fuzzy: candidates sharing the first two characters with a length within
+        # the edit cap, read from the length-bucketed section
+        cap = 1 if len(tok) < 8 else 2
+        best, best_d = -1, cap + 1
+        for length in sorted(range(len(tok) - cap, len(tok) + cap + 1), key=lambda L: abs(L - len(tok))):
+            start = self._lower_bound(n, self._fuzzy_key_at, (tok[:2], length, ""))
+            for k in range(start, min(n, start + _FUZZY_BUCKET_SCAN)):
+                tid, cand = self._fuzzy(k)
+                if len(cand) != length or not cand.startswith(tok[:2]):
+                    break
+                d = _levenshtein(tok, cand, min(cap, best_d - 1))
+                if d < best_d:
+                    best, best_d = tid, d
+                    if d == 1:
+                        return best, best_d
+        return (best, best_d) if best >= 0 else (-1, 0)
+
+    def _fuzzy(self, i: int) -> Tuple[int, str]:
+        tid, off, length = _FUZZY.unpack_from(self._mm, self._off["fuzzy"] + i * _FUZZY.size)
+        return tid, self._str(off, length)
+
+    def _fuzzy_key_at(self, i: int) -> Tuple[str, int, str]:
+        return _fuzzy_key(self._fuzzy(i)[1])
+
+    def _node(self, i: int) -> Tuple[int, int, int, int, int]:
+        return _NODE.unpack_from(self._mm, self._off["nodes"] + i * _NODE.size)
+
+    def _goto(self, node: int, tid: int) -> int:
+        _, _, _, start, count = self._node(node)
+        lo, hi = start, start + count
+        base = self._off["trans"]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            t, child = _TRANS.unpack_from(self._mm, base + mid * _TRANS.size)
+            if t == tid:
+                return child
+            if t < tid:
+                lo = mid + 1
+            else:
+                hi = mid
+        return -1
+
+    def _entries_from(self, first: int) -> List[int]:
+        term, out, i = self._term(first), [], first
+        while i < self.counts["entries"] and self._term(i) == term:
+            out.append(i)
+            i += 1
+        return out
+
+    def _prefix_range(self, target: str, limit: int) -> List[Tuple[int, str]]:
+        """(entry index, normalized term) for terms starting with target."""
+        n = self.counts["entries"]
+        i = self._lower_bound(n, self._term, target)
+        out = []
+        while i < n and len(out) < limit:
+            term = self._term(i)
+            if not term.startswith(target):
+                break
+            out.append((i, term))
+            i += 1
+        return out
+
+    def prefix(self, text: str, limit: int = 10) -> List[Dict[str, str]]:
+        """Entries whose normalized term starts with the normalized text."""
+        target = " ".join(normalize(text))
+        if not target:
+            return []
+        return [self._entry(i) for i, _ in self._prefix_range(target, limit)]
+
+    def _covering(self, tokens: List[str], ids: List[Tuple[int, int]],
+                  limit: int = 20) -> List[Tuple[int, str, int]]:
+        """
+        Reverse path: (entry, term, fuzz) triples for terms that start with the longest
+        known prefix of the query tokens (e.g. 'troponin i' -> 'troponin i cardiac',
+        'aspirin 325 mg po once' -> 'aspirin 325 mg oral tablet').
+        """
+        known = []
+        for tid, edits in ids:
+            if tid < 0:
+                break
+            known.append((self._vocab(tid), edits))
+        # A single shared leading token is too weak a signal for a multi-token query
+        shortest = 1 if len(tokens) == 1 else 2
+        for plen in range(len(known), shortest - 1, -1):
+            target = " ".join(t for t, _ in known[:plen])
+            fuzz = sum(e for _, e in known[:plen])
+            # Whole-token prefixes only ('troponin i' must not match 'troponin ii')
+            hits = [(i, term, fuzz) for i, term in self._prefix_range(target, limit)
+                    if len(term) == len(target) or term[len(target)] == " "]
+            if hits:
+                return hits
+        return []
+
+    @staticmethod
+    def _score(shared: int, query_len: int, term_len: int, fuzz: int, short: bool = False) -> float:
+        score = 0.5 * shared / query_len + 0.5 * shared / term_len
+        # A lone short token ('i', 'mg') inside a longer name is usually noise
+        if shared == 1 and query_len > 1 and short:
+            score *= _SINGLE_TOKEN_PENALTY
+        return round(score * (0.85 ** fuzz), 3)
+
+    def lookup(
+        self,
+        text: str,
+        k: int = 3,
+        systems: Optional[Sequence[str]] = None,
+        min_score: float = MIN_MATCH_SCORE,
+    ) -> List[Dict[str, object]]:
+        """
+        Find catalog terms contained in text (token-level Aho-Corasick with fuzzy
+        token matching) or starting with its leading tokens. Matches are scored on
+        coverage of both sides, score = (0.5 * shared/query tokens + 0.5 *
+        shared/term tokens) * 0.85**edits, so an exact full-string match scores
+        1.0; a short single-token term inside a multi-token text is penalized
+        and anything below min_score is dropped.
+        """
+        tokens = normalize(text)
+        if not tokens or not self.counts["entries"]:
+            return []
+        ids = [self._token_id(t) for t in tokens]
+
+        best: Dict[Tuple[str, str], Dict[str, object]] = {}
+
+        def consider(entry_idx: int, score: float) -> None:
+            if score < min_score or (systems and self._system(entry_idx) not in systems):
+                return
+            entry = self._entry(entry_idx)
+            key = (entry["system"], entry["code"])
+            if key not in best or best[key]["score"] < score:
+                best[key] = dict(entry, score=score)
+
+        state, depth_edits = 0, []
+        for pos, (tid, edits) in enumerate(ids):
+            if tid < 0:
+                state, depth_edits = 0, []
+                continue
+            while state and self._goto(state, tid) < 0:
+                state = self._node(state)[0]
+            nxt = self._goto(state, tid)
+            state = nxt if nxt >= 0 else 0
+            depth_edits.append(edits)
+
+            node = state
+            _, out, link, _, _ = self._node(node)
+            if out < 0:
+                node = link
+            while node >= 0:
+                _, out, link, _, _ = self._node(node)
+                term = self._term(out)
+                span = len(term.split(" "))
+                score = self._score(span, len(tokens), span, sum(depth_edits[-span:]), len(term) < 4)
+                for e in self._entries_from(out):
+                    consider(e, score)
+                node = link
+
+        query = set(tokens) | {self._vocab(tid) for tid, _ in ids if tid >= 0}
+        for e, term, fuzz in self._covering(tokens, ids):
+            term = term.split(" ")
+            shared = min(len(tokens), sum(1 for t in term if t in query))
+            consider(e, self._score(shared, len(tokens), len(term), fuzz))
+
+        return sorted(best.values(), key=lambda m: (-m["score"], m["system"], m["code"]))[:k]
+
+    def annotate(
+        self,
+        name: str,
+        order_type: Optional[str] = None,
+        k: int = 3,
+        min_score: float = MIN_MATCH_SCORE,
+    ) -> List[Dict[str, object]]:
+        # Known order types only get codes from their own catalogs (no drug codes on labs)
+        systems = ORDER_TYPE_SYSTEMS.get((order_type or "").lower())
+        return self.lookup(name, k=k, systems=systems, min_score=min_score)
+
+
+_index: Optional[TerminologyIndex] = None
+_index_loaded = False
+_index_lock = threading.Lock()
+
+
+def get_terminology_index() -> Optional[TerminologyIndex]:
+    """
+    Process-wide index from MEDSCRIBE_TERMINOLOGY_INDEX (a file produced by the
+    build step). Returns None when unset or unreadable, so annotation is optional.
+    """
+    global _index, _index_loaded
+    with _index_lock:
+        if not _index_loaded:
+            path = os.getenv("MEDSCRIBE_TERMINOLOGY_INDEX", "")
+            try:
+                _index = TerminologyIndex(path) if path else None
+            except Exception:
+                _index = None
+            _index_loaded = True
+        return _index
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Build or query the local terminology index (LOINC/RxNorm/CPT catalogs)"
+    )
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_build = sub.add_parser("build", help="Compile CSV/TSV catalogs into an index file")
+    p_build.add_argument("out", help="Output index path")
+    p_build.add_argument("catalogs", nargs="+", help="Catalog files (code, display[, system])")
+    p_query = sub.add_parser("lookup", help="Look up a free-text order name")
+    p_query.add_argument("index", help="Index path")
+    p_query.add_argument("text", help="Order name, e.g. 'Troponin I'")
+    p_query.add_argument("--type", dest="order_type", default=None, help="Order type (lab, medication, ...)")
+
+    args = parser.parse_args()
+    try:
+        if args.cmd == "build":
+            print(json.dumps(build_index(args.catalogs, args.out)))
+        else:
+            print(json.dumps(TerminologyIndex(args.index).annotate(args.text, args.order_type), indent=2))
+    except Exception as exc:  # pragma: no cover - CLI convenience
+        sys.stderr.write(f"[error] {exc}\n")
+        sys.exit(1)
@@ -1,12 +1,12 @@
 import re
 from typing import Dict, List, Tuple
 
-_SENT_SPLIT = re.compile(r'(?<=[.!?])\s+|\n+')
+SENT_SPLIT = re.compile(r'(?<=[.!?])\s+|\n+')
 _TOKEN = re.compile(r"[a-z0-9]+")
 
 
 def split_into_sentences(text: str) -> List[Tuple[int, str]]:
-    raw = [s.strip() for s in _SENT_SPLIT.split(text or "") if s.strip()]
+    raw = [s.strip() for s in SENT_SPLIT.split(text or "") if s.strip()]
     return [(i + 1, s) for i, s in enumerate(raw)]
 
 
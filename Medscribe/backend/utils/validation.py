@@ -1,4 +1,5 @@
 from typing import Dict, List, Any
+from .terminology import get_terminology_index
 from .text_index import jaccard_similarity
 
 
@@ -15,6 +16,7 @@ def validate_outputs(
     payload: Dict[str, Any],
     id_to_sentence: Dict[int, str],
     threshold: float = 0.30,
+    annotate_codes: bool = True,
 ) -> Dict[str, Any]:
     out = {
         "summary_bullets": [],
@@ -34,6 +36,9 @@ def validate_outputs(
                 "support_score": score,
             })
 
+    # Optional: normalize order names against local LOINC/RxNorm/CPT catalogs
+    terminology = get_terminology_index() if annotate_codes else None
+
     for o in payload.get("suggested_orders") or []:
         name = (o or {}).get("name", "")
         reason = (o or {}).get("reason", "")
@@ -51,6 +56,10 @@ def validate_outputs(
             ext = (o or {}).get("external_citations") or []
             if ext:
                 item["external_citations"] = ext
+            if terminology is not None:
+                codes = terminology.annotate(name, item["type"])
+                if codes:
+                    item["codes"] = codes
             out["suggested_orders"].append(item)
 
     return out
@@ -1,4 +1,3 @@
-import os
 import sys
 import json
 from typing import Optional, Dict, Any, List, Tuple
@@ -9,14 +8,11 @@ except Exception:  # pragma: no cover
     load_dotenv = None  # type: ignore
     find_dotenv = None  # type: ignore
 
-try:
-    # Reuse existing helper and consistent config
-    from .agent import _get_wx_model  # type: ignore
-except Exception as exc:  # pragma: no cover
-    _get_wx_model = None  # type: ignore
+from .providers import has_live_provider, run_generation, run_generation_batch
+from .utils.generation import citation_profile, summary_profile
 
 
-__all__ = ["watsonx_summarize", "watsonx_summarize_with_citations"]
+__all__ = ["watsonx_summarize", "watsonx_summarize_with_citations", "watsonx_summarize_with_citations_batch"]
 
 
 def _load_env() -> None:
@@ -28,15 +24,11 @@ def _load_env() -> None:
 
 
 def _ensure_wx_ready() -> None:
-    if _get_wx_model is None:
-        raise RuntimeError("agent._get_wx_model unavailable; check installation")
-    # Minimal validation so errors are clearer before API call
-    required = ["WATSONX_APIKEY", "WATSONX_PROJECT_ID"]
-    missing = [k for k in required if not os.getenv(k)]
-    if missing:
+    # Minimal validation so errors are clearer before any model call
+    if not has_live_provider():
         raise RuntimeError(
-            "Missing environment: " + ", ".join(missing) +
-            ". Ensure your .env is loaded."
+            "No model provider configured: set WATSONX_APIKEY and WATSONX_PROJECT_ID, "
+            "or LOCAL_MODEL_PATH for the local backend. Ensure your .env is loaded."
         )
 
 
@@ -63,13 +55,15 @@ def watsonx_summarize(
     style: Optional[str] = None,
 ) -> str:
     """
-    Summarize input text using IBM watsonx.ai foundation model configured via .env.
+    Summarize input text using IBM watsonx.ai foundation model configured via .env,
+    falling back to the local backend (see providers) when watsonx is unavailable.
 
     Expects environment variables (via .env):
-      - WATSONX_APIKEY (required)
-      - WATSONX_PROJECT_ID (required)
+      - WATSONX_APIKEY / WATSONX_PROJECT_ID (required for watsonx)
       - WATSONX_URL (optional; default in helper)
       - WATSONX_MODEL (optional; default in helper)
+      - LOCAL_MODEL_PATH (optional; GGUF model for the local backend)
+      - MEDSCRIBE_PROVIDER (optional; "auto", "watsonx" or "local")
     """
     _load_env()
     src = (text or "").strip()
@@ -77,13 +71,8 @@ def watsonx_summarize(
         raise ValueError("text must be at least 5 characters")
 
     _ensure_wx_ready()
-    model = _get_wx_model()
     prompt = _build_prompt(src, style)
-    result = model.generate(prompt=prompt)
-    if isinstance(result, dict):
-        items = result.get("results") or []
-        return (items[0].get("generated_text", "") if items else "").strip()
-    return str(result).strip()
+    return run_generation(prompt, summary_profile(src))[0]
 
 
 def _read_all_stdin() -> str:
@@ -246,18 +235,46 @@ def watsonx_summarize_with_citations(
     if len(src) < 5:
         raise ValueError("text must be at least 5 characters")
     _ensure_wx_ready()
-    model = _get_wx_model()
     prompt = _build_citation_prompt(src, numbered_sentences, style)
-    result = model.generate(prompt=prompt)
-    if isinstance(result, dict):
-        items = result.get("results") or []
-        content = (items[0].get("generated_text", "") if items else "").strip()
-    else:
-        content = str(result).strip()
+    # meta lets the cassette store replay this call through parsing/validation offline
+    meta = {"kind": "citation", "note_text": src, "numbered_sentences": numbered_sentences, "style": style}
+    content, model_info = run_generation(prompt, citation_profile(numbered_sentences), meta=meta)
     payload = _extract_json(content)
+    payload["model_info"] = model_info
     return payload
 
 
+def watsonx_summarize_with_citations_batch(
+    items: List[Tuple[str, List[Tuple[int, str]]]],
+    *,
+    style: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Batched variant for (text, numbered_sentences) pairs, e.g. windows of one
+    large document. An item whose output is not valid JSON yields an empty
+    payload instead of failing the whole batch.
+    """
+    _load_env()
+    _ensure_wx_ready()
+    prompts, metas = [], []
+    for text, numbered_sentences in items:
+        src = (text or "").strip()
+        prompts.append(_build_citation_prompt(src, numbered_sentences, style))
+        metas.append({"kind": "citation", "note_text": src, "numbered_sentences": numbered_sentences, "style": style})
+    # One profile for the batch, sized for the largest item
+    profile = citation_profile(max((n for _, n in items), key=len, default=[]))
+    contents, model_info = run_generation_batch(prompts, profile, metas=metas)
+    payloads = []
+    for content in contents:
+        try:
+            payload = _extract_json(content)
+        except ValueError:
+            payload = {}
+        payload["model_info"] = model_info
+        payloads.append(payload)
+    return payloads
+
+
 if __name__ == "__main__":
     import argparse
 